@@ -0,0 +1,69 @@
+import argparse
+import random
+import time
+
+from indexing.analysis import analyze, stem, term_counts
+
+WORDS = """the search engine crawls pages and ranks them by links between pages while the index
+stores every word with how often it appears running runs runner ran connection connected
+connecting connections history historical historian government governments governing
+information informational informed computer computing computers computed network networks
+university universities student students studying studied news world politics political
+economy economic economies science scientific scientists football players played playing
+it's don't can't we'll state-of-the-art e-mail 2024 covid-19 u.s. naïve café""".split()
+
+# Pseudo text with the punctuation, numbers and contractions of real pages
+def make_text(tokens, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(tokens):
+        word = rng.choice(WORDS)
+        if rng.random() < 0.1:
+            word = word.capitalize()
+        parts.append(word + rng.choice(["", "", "", ",", ".", ";", "!", ")"]))
+    return " ".join(parts)
+
+# The analysis the indexer and the server used before, per call
+def nltk_analyze(text):
+    from nltk.corpus import stopwords
+    from nltk.stem import PorterStemmer
+    from nltk.tokenize import word_tokenize
+
+    ps = PorterStemmer()
+    stop_words = set(stopwords.words('english'))
+    tokens = word_tokenize(text.lower())
+    return [ps.stem(word) for word in tokens if word.isalpha() and word not in stop_words]
+
+def time_tokens(function, texts, tokens):
+    start = time.perf_counter()
+    for text in texts:
+        function(text)
+    return tokens / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare text analysis speed with the old NLTK path")
+    parser.add_argument("--pages", type=int, default=200, help="number of pages to analyze")
+    parser.add_argument("--tokens", type=int, default=2000, help="tokens per page")
+    options = parser.parse_args()
+
+    texts = [make_text(options.tokens, seed) for seed in range(options.pages)]
+    total = options.pages * options.tokens
+
+    stem.cache_clear()
+    print(f"analyze:      {time_tokens(analyze, texts, total):,.0f} tokens/sec (cold stem cache)")
+    print(f"analyze:      {time_tokens(analyze, texts, total):,.0f} tokens/sec (warm stem cache)")
+    try:
+        print(f"nltk:         {time_tokens(nltk_analyze, texts, total):,.0f} tokens/sec")
+    except LookupError:
+        print("nltk:         skipped, NLTK tokenizer data is not installed")
+
+    # A word searched on its own must give terms that the page containing it was indexed under
+    for text in texts:
+        indexed = term_counts(text)
+        for word in set(text.split()):
+            for term in analyze(word):
+                assert term in indexed, (word, term)
+    print("index-time and query-time terms are identical")
+
+if __name__ == "__main__":
+    main()
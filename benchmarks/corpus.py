@@ -0,0 +1,36 @@
+import numpy as np
+
+# Fill an empty search.db with crawled pages, words, postings and links
+# Word frequencies follow a zipf distribution like real text
+def build_corpus(connection, pages, vocabulary=50000, words_per_page=150, links_per_page=20, seed=0):
+    cursor = connection.cursor()
+    rng = np.random.default_rng(seed)
+
+    cursor.executemany("INSERT INTO WORDS (id, word) VALUES (?, ?)", ((word_id, f"word{word_id}") for word_id in range(1, vocabulary + 1)))
+
+    url_data = []
+    postings = []
+    for page_id in range(1, pages + 1):
+        tokens = rng.zipf(1.3, words_per_page * 3) % vocabulary + 1
+        word_ids, frequencies = np.unique(tokens, return_counts=True)
+        url_data.append((page_id, f"http://synthetic.test/page/{page_id}", f"Page {page_id}", "", int(len(tokens))))
+        postings.extend(zip([page_id] * len(word_ids), word_ids.tolist(), frequencies.tolist()))
+
+        # Flush every few thousand pages to keep memory flat
+        if len(postings) > 500000:
+            insert_postings(cursor, url_data, postings)
+            url_data = []
+            postings = []
+    insert_postings(cursor, url_data, postings)
+
+    # Half of the links favour low page ids so the rank distribution is skewed
+    sources = np.repeat(np.arange(1, pages + 1), links_per_page)
+    skewed = rng.random(len(sources)) < 0.5
+    targets = np.where(skewed, rng.zipf(1.5, len(sources)) % pages, rng.integers(0, pages, len(sources))) + 1
+    cursor.executemany("INSERT OR IGNORE INTO CONNECTIONS (source_id, target_id) VALUES (?, ?)", zip(sources.tolist(), targets.tolist()))
+
+    connection.commit()
+
+def insert_postings(cursor, url_data, postings):
+    cursor.executemany("INSERT INTO URLs (id, url, title, description, word_count, crawled) VALUES (?, ?, ?, ?, ?, 1)", url_data)
+    cursor.executemany("INSERT INTO INVERTED_INDEX (page_id, word_id, frequency) VALUES (?, ?, ?)", postings)
@@ -0,0 +1,63 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.web import SyntheticWeb
+from main import db_connect, spider_bot
+from monitoring.crawl import FETCH_SECONDS, PAGES, PARSE_SECONDS, RANK_SECONDS, WRITE_SECONDS
+
+RANK_PHASES = ["pagerank", "tf_idf", "combine_scores"]
+
+def milliseconds(value):
+    return "-" if value is None else f"{value * 1000:g}ms"
+
+# Crawl a synthetic web into db_path and print where the time went
+def run(web, db_path, mode="threads", max_urls=10000, per_host=20):
+    seed = web.start()
+    connection, cursor = db_connect(db_path)
+    try:
+        start = time.perf_counter()
+        spider_bot(connection, cursor, mode, seeds=[seed], max_urls=max_urls, domain_delay=0.0, per_host=per_host)
+        total = time.perf_counter() - start
+
+        cursor.execute("SELECT COUNT(*) FROM URLs WHERE crawled = 1 AND word_count > 0")
+        pages = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM INVERTED_INDEX")
+        postings = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM BLOCKED_URLs")
+        blocked = cursor.fetchone()[0]
+    finally:
+        connection.close()
+        web.stop()
+
+    ranking = sum(RANK_SECONDS.sum(phase=phase) for phase in RANK_PHASES)
+    crawl = total - ranking
+    print(f"{mode}: {pages} pages indexed, {postings} postings, {blocked} blocked urls")
+    print(f"  crawl:          {crawl:.2f}s ({PAGES.get(result='indexed') / crawl:.1f} pages/sec)")
+    print(f"  fetch p50/p99:  {milliseconds(FETCH_SECONDS.quantile(0.5))}/{milliseconds(FETCH_SECONDS.quantile(0.99))}")
+    print(f"  parse p50/p99:  {milliseconds(PARSE_SECONDS.quantile(0.5))}/{milliseconds(PARSE_SECONDS.quantile(0.99))}")
+    print(f"  write p50/p99:  {milliseconds(WRITE_SECONDS.quantile(0.5))}/{milliseconds(WRITE_SECONDS.quantile(0.99))}")
+    for phase in RANK_PHASES:
+        print(f"  {phase + ':':<15} {RANK_SECONDS.sum(phase=phase):.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time spider_bot and the ranking phases against a synthetic web on localhost")
+    parser.add_argument("--pages", type=int, default=1000, help="number of HTML pages in the synthetic web")
+    parser.add_argument("--fan-out", type=int, default=10, help="links on each page")
+    parser.add_argument("--disallowed", type=float, default=0.05, help="share of links disallowed by robots.txt")
+    parser.add_argument("--words", type=int, default=300, help="average words on a page")
+    parser.add_argument("--mode", choices=["threads", "async"], default="threads")
+    parser.add_argument("--per-host", type=int, default=20, help="requests at once to the synthetic host")
+    parser.add_argument("--db", help="keep the crawled database at this path, for benchmarks.search_load")
+    options = parser.parse_args()
+
+    web = SyntheticWeb(options.pages, options.fan_out, options.disallowed, words=options.words)
+    if options.db:
+        run(web, options.db, options.mode, options.pages, options.per_host)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(web, os.path.join(directory, "search.db"), options.mode, options.pages, options.per_host)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import contextlib
+import io
+import numpy as np
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.web import SyntheticWeb
+from crawling.writer import IndexWriter
+from database.schema import connect
+from indexing.extractor import extract
+from indexing.parser import parse_page
+
+# The search server's modules are imported flat from its folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+from query_engine import SqliteIndex, score_pages, top_k
+from searching import analyze_query
+
+# Index the synthetic web's pages straight through the writer, with or without word positions
+def build(web, db_path, positions):
+    connection, cursor = connect(db_path)
+    urls = [f"{web.base_url}/page/{number}.html" for number in range(web.pages)]
+    cursor.executemany("INSERT OR IGNORE INTO URLs (url) VALUES (?)", [(url, ) for url in urls])
+    connection.commit()
+
+    writer = IndexWriter(connection, duplicate_distance=None)
+    writer.start()
+    for number, url in enumerate(urls):
+        # index_text prints every page
+        with contextlib.redirect_stdout(io.StringIO()):
+            indexed_page = parse_page(url, web.page(number).encode("utf-8"), "text/html", positions=positions)
+        writer.page(url, indexed_page, [])
+    writer.close()
+
+    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    try:
+        cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = 'INVERTED_INDEX'")
+        table_bytes = cursor.fetchone()[0]
+    except sqlite3.OperationalError:
+        # sqlite built without the dbstat table
+        table_bytes = None
+    connection.close()
+    return table_bytes, os.path.getsize(db_path)
+
+# Quoted runs of two or three words copied from random pages, so every phrase is on some page
+def make_phrases(web, count, seed=0):
+    rng = random.Random(seed)
+    phrases = []
+    while len(phrases) < count:
+        words = extract(web.page(rng.randrange(web.pages)).encode("utf-8"), "text/html").text().split()
+        length = rng.randint(2, 3)
+        start = rng.randrange(len(words) - length)
+        phrases.append('"' + " ".join(words[start:start + length]) + '"')
+    return phrases
+
+# Latency of scoring and picking the first page of results, and how many pages matched on average
+def time_queries(db_path, queries, **options):
+    connection = sqlite3.connect(db_path)
+    index = SqliteIndex(connection.cursor())
+    latencies = []
+    matches = 0
+    for query in queries:
+        words, match, phrases = analyze_query(query)
+        start = time.perf_counter()
+        scores = score_pages(index, words, match, phrases=phrases, **options)
+        top_k(scores, 20)
+        latencies.append(time.perf_counter() - start)
+        matches += len(scores)
+    connection.close()
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return p50, p99, matches / len(queries)
+
+def megabytes(value):
+    return "-" if value is None else f"{value / 1024 / 1024:.1f} MB"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare index size and query latency with and without word positions")
+    parser.add_argument("--pages", type=int, default=2000, help="pages of the synthetic web to index")
+    parser.add_argument("--words", type=int, default=300, help="average words on a page")
+    parser.add_argument("--queries", type=int, default=300, help="queries of each kind")
+    options = parser.parse_args()
+
+    web = SyntheticWeb(options.pages, words=options.words)
+    # Pages are generated without serving them, the url is only used in links and image sources
+    web.base_url = "http://127.0.0.1:8765"
+    word_queries = [query for query in web.queries(options.queries * 3) if len(query.split()) > 1][:options.queries]
+    phrase_queries = make_phrases(web, options.queries)
+
+    with tempfile.TemporaryDirectory() as directory:
+        plain_path = os.path.join(directory, "plain.db")
+        positions_path = os.path.join(directory, "positions.db")
+
+        start = time.perf_counter()
+        plain_table, plain_file = build(web, plain_path, False)
+        plain_time = time.perf_counter() - start
+        start = time.perf_counter()
+        positions_table, positions_file = build(web, positions_path, True)
+        positions_time = time.perf_counter() - start
+
+        print(f"{options.pages} pages, about {options.words} words each")
+        print(f"  INVERTED_INDEX:  {megabytes(plain_table)} without positions, {megabytes(positions_table)} with positions")
+        print(f"  search.db:       {megabytes(plain_file)} without positions, {megabytes(positions_file)} with positions")
+        print(f"  indexing:        {plain_time:.1f}s without positions, {positions_time:.1f}s with positions")
+
+        # Without positions the proximity lookups could only find nothing, so they are turned off
+        runs = [
+            ("words, no positions", plain_path, word_queries, {"proximity_weight": 0}),
+            ("words, proximity", positions_path, word_queries, {}),
+            ("phrase as words", plain_path, phrase_queries, {}),
+            ("phrase", positions_path, phrase_queries, {}),
+        ]
+        for name, db_path, queries, query_options in runs:
+            p50, p99, matches = time_queries(db_path, queries, **query_options)
+            print(f"  {name + ':':<21} p50 {p50:.2f}ms, p99 {p99:.2f}ms, {matches:.1f} matching pages")
+
+if __name__ == "__main__":
+    main()
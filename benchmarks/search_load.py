@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import WSGIRequestHandler, make_server
+import argparse
+import numpy as np
+import os
+import random
+import requests
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.web import SyntheticWeb
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+
+# The website on a free port from a daemon thread, serving db_path
+# The server reads search.db and the compact index from its working directory, so it runs from the database's folder
+def start_server(db_path):
+    os.chdir(os.path.dirname(os.path.abspath(db_path)))
+    sys.path.insert(0, SERVER_DIR)
+    import searching
+    from search_api import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    searching.pool.path = os.path.abspath(db_path)
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", searching.result_cache
+
+# Requests made from a query log the way people use the site:
+# every query opens the results page, some scroll to the next page, some look at the images
+def make_requests(queries, seed=0):
+    rng = random.Random(seed)
+    made = []
+    for query in queries:
+        made.append(("GET", "/search", query, 1))
+        if rng.random() < 0.3:
+            made.append(("POST", "/search", query, 2))
+        if rng.random() < 0.3:
+            made.append(("GET", "/images", query, 1))
+            if rng.random() < 0.3:
+                made.append(("POST", "/images", query, 2))
+    return made
+
+# Send every request from concurrency clients, returns {route: latencies}, errors and the seconds it took
+def replay(base_url, made, concurrency):
+    local = threading.local()
+
+    def send(request):
+        method, route, query, page = request
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        if method == "GET":
+            response = local.session.get(base_url + route, params={"search": query})
+        elif route == "/search":
+            response = local.session.post(base_url + route, params={"search": query, "page": page})
+        else:
+            response = local.session.post(base_url + route, params={"search": query}, json={"page": page})
+        return f"{method} {route}", time.perf_counter() - start, response.status_code >= 400
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, made))
+    elapsed = time.perf_counter() - start
+
+    latencies = {}
+    errors = 0
+    for route, latency, failed in results:
+        latencies.setdefault(route, []).append(latency)
+        errors += failed
+    return latencies, errors, elapsed
+
+def report(latencies, errors, elapsed):
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} requests/sec), {errors} errors")
+    every = [latency for values in latencies.values() for latency in values]
+    for route, values in sorted(latencies.items()) + [("all", every)]:
+        p50, p99 = np.percentile(values, [50, 99]) * 1000
+        print(f"  {route + ':':<14} {len(values):>6} requests, p50 {p50:.1f}ms, p99 {p99:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a query log against the website's /search and /images routes")
+    parser.add_argument("--db", help="search.db to serve, by default a synthetic web is crawled into a temporary one")
+    parser.add_argument("--queries", help="query log with one query per line, by default queries are generated from the synthetic web's words")
+    parser.add_argument("--count", type=int, default=2000, help="number of generated queries")
+    parser.add_argument("--pages", type=int, default=1000, help="pages of the synthetic web to crawl without --db")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients sending requests at once")
+    parser.add_argument("--passes", type=int, default=2, help="times to replay the log, later passes show the result cache")
+    options = parser.parse_args()
+
+    web = SyntheticWeb(options.pages)
+    if options.queries:
+        with open(options.queries, encoding="utf-8") as file:
+            queries = [line.strip() for line in file if line.strip()]
+    else:
+        queries = web.queries(options.count)
+    made = make_requests(queries)
+
+    directory = None
+    db_path = options.db
+    if db_path is None:
+        from benchmarks.crawl import run
+        directory = tempfile.TemporaryDirectory()
+        db_path = os.path.join(directory.name, "search.db")
+        run(web, db_path)
+
+    server, base_url, result_cache = start_server(db_path)
+    try:
+        for number in range(1, options.passes + 1):
+            hits, misses = result_cache.hits, result_cache.misses
+            latencies, errors, elapsed = replay(base_url, made, options.concurrency)
+            lookups = result_cache.hits - hits + result_cache.misses - misses
+            print(f"Pass {number}: result cache hit ratio {(result_cache.hits - hits) / max(lookups, 1):.0%}")
+            report(latencies, errors, elapsed)
+    finally:
+        server.shutdown()
+        if directory is not None:
+            os.chdir(os.path.dirname(directory.name))
+            directory.cleanup()
+
+if __name__ == "__main__":
+    main()
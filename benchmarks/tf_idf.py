@@ -0,0 +1,68 @@
+import argparse
+import math
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import build_corpus
+from main import db_connect
+from ranking.pagerank import tf_idf
+
+# The old row by row version, kept to compare against
+def legacy_tf_idf(connection, cursor):
+    cursor.execute("SELECT COUNT(*) FROM URLs WHERE crawled = 1")
+    count = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT i.word_id, i.page_id, i.frequency, u.word_count
+        FROM INVERTED_INDEX i
+        JOIN URLs u ON i.page_id = u.id
+        WHERE u.crawled = 1 AND u.word_count > 0
+    """)
+
+    buffer = []
+    for word_id, page_id, freq, word_count in cursor.fetchall():
+        cursor.execute("SELECT COUNT(*) FROM INVERTED_INDEX WHERE word_id = ?", (word_id, ))
+        docs_containing_word = cursor.fetchone()[0]
+        score = round(freq / word_count * math.log(count / docs_containing_word), 6)
+        buffer.append((score, word_id, page_id))
+    cursor.executemany("UPDATE INVERTED_INDEX SET score = ? WHERE word_id = ? AND page_id = ?", buffer)
+    connection.commit()
+
+def run(pages, legacy):
+    with tempfile.TemporaryDirectory() as directory:
+        connection, cursor = db_connect(os.path.join(directory, "search.db"))
+
+        start = time.perf_counter()
+        build_corpus(connection, pages)
+        build_time = time.perf_counter() - start
+        cursor.execute("SELECT COUNT(*) FROM INVERTED_INDEX")
+        postings = cursor.fetchone()[0]
+
+        start = time.perf_counter()
+        tf_idf(connection, cursor)
+        tf_idf_time = time.perf_counter() - start
+
+        legacy_time = None
+        if legacy:
+            start = time.perf_counter()
+            legacy_tf_idf(connection, cursor)
+            legacy_time = time.perf_counter() - start
+
+        connection.close()
+
+    print(f"{pages} pages, {postings} postings (built in {build_time:.1f}s)")
+    print(f"  tf_idf:        {tf_idf_time:.2f}s")
+    if legacy_time is not None:
+        print(f"  legacy tf_idf: {legacy_time:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time tf_idf on synthetic corpora")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10000, 100000], help="corpus sizes to run")
+    parser.add_argument("--legacy", action="store_true", help="also time the old per row implementation (slow)")
+    options = parser.parse_args()
+
+    for pages in options.pages:
+        run(pages, options.legacy)
+
+if __name__ == "__main__":
+    main()
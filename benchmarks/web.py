@@ -0,0 +1,159 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import itertools
+import random
+import re
+import threading
+
+# A generated web served from localhost, so crawls can be timed without touching real sites
+# Every page is built from its number and the seed, the same options always give the same web
+
+SYLLABLES = ["ba", "ce", "di", "fo", "gu", "ha", "je", "ki", "lo", "mu", "na", "pe", "qui", "ro", "su",
+             "ta", "ve", "wi", "xo", "yu", "za", "bre", "cla", "dro", "fli", "gra", "plo", "str", "tha", "vin"]
+
+# Made up words, so pages do not share one small vocabulary and look like near-duplicates
+def make_vocabulary(size, seed=0):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    # Sorted first so the order only depends on the seed, the most common words come first
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+class SyntheticWeb:
+    # pages: number of HTML pages, fan_out: links per page
+    # disallowed: share of links into /private/, which robots.txt disallows
+    # binary: share of links to PDF files, which are stored without being indexed
+    # words: average words per page, the length of a page varies from half to one and a half times this
+    def __init__(self, pages=1000, fan_out=10, disallowed=0.05, binary=0.02, words=300, images=2, vocabulary=20000, seed=0):
+        self.pages = pages
+        self.fan_out = fan_out
+        self.disallowed = disallowed
+        self.binary = binary
+        self.words = words
+        self.images = images
+        self.seed = seed
+        self.vocabulary = make_vocabulary(vocabulary, seed)
+        # Zipf word frequencies like real text
+        self.weights = list(itertools.accumulate(1.0 / rank ** 1.1 for rank in range(1, vocabulary + 1)))
+        self.server = None
+        self.base_url = None
+
+    def text(self, rng, count, topic=()):
+        words = rng.choices(self.vocabulary, cum_weights=self.weights, k=count)
+        # Like real pages, most words are about the page's own topic and the rest are common words
+        if topic:
+            words = [rng.choice(topic) if rng.random() < 0.6 else word for word in words]
+        return " ".join(words)
+
+    # Half of the links go to low page numbers, so a few pages collect most of the rank
+    def link(self, rng):
+        if rng.random() < 0.5:
+            target = min(int(rng.paretovariate(1.2)) - 1, self.pages - 1)
+        else:
+            target = rng.randrange(self.pages)
+        roll = rng.random()
+        if roll < self.disallowed:
+            return f"/private/{target}.html"
+        if roll < self.disallowed + self.binary:
+            return f"/files/{target}.pdf"
+        return f"/page/{target}.html"
+
+    def page(self, number):
+        rng = random.Random(self.seed * 1000003 + number)
+        topic = rng.sample(self.vocabulary, 50)
+        title = self.text(rng, 4, topic)
+        paragraphs = []
+        remaining = rng.randint(self.words // 2, self.words * 3 // 2)
+        while remaining > 0:
+            length = min(remaining, rng.randint(30, 120))
+            paragraphs.append(f"<p>{self.text(rng, length, topic)}</p>")
+            remaining -= length
+        # Images need a protocol-relative src to be kept by the indexer
+        host = self.base_url.split("//", 1)[1]
+        for image in range(self.images):
+            position = rng.randrange(len(paragraphs) + 1)
+            paragraphs.insert(position, f'<img src="//{host}/images/{number}-{image}.jpg" alt="{self.text(rng, 3, topic)}">')
+        links = "".join(f'<li><a href="{self.link(rng)}">{self.text(rng, 2)}</a></li>' for _ in range(self.fan_out))
+        return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title>"
+                f"<meta name=\"description\" content=\"{self.text(rng, 12, topic)}\"></head>"
+                f"<body><h1>{title}</h1>{''.join(paragraphs)}<ul>{links}</ul></body></html>")
+
+    def robots(self):
+        return "User-agent: *\nDisallow: /private/\n"
+
+    # Status, content type and body of a path
+    def respond(self, path):
+        if path == "/robots.txt":
+            return 200, "text/plain", self.robots().encode("utf-8")
+        match = re.fullmatch(r"/(page|private)/(\d+)\.html", path)
+        if match and int(match.group(2)) < self.pages:
+            return 200, "text/html; charset=utf-8", self.page(int(match.group(2))).encode("utf-8")
+        if re.fullmatch(r"/files/\d+\.pdf", path):
+            return 200, "application/pdf", b"%PDF-1.4\n%synthetic\n"
+        return 404, "text/plain", b"Not found"
+
+    # Serve on a free port from a daemon thread, returns the url of the first page
+    def start(self, host="127.0.0.1", port=0):
+        web = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, content_type, body = web.respond(self.path.split("?", 1)[0])
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # Room for every crawl worker's connection in the listen backlog
+            request_queue_size = 128
+            daemon_threads = True
+
+        self.server = Server((host, port), Handler)
+        self.base_url = f"http://{host}:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"{self.base_url}/page/0.html"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    # Queries made of words the pages contain, common words are searched more often
+    def queries(self, count, seed=0):
+        rng = random.Random(seed)
+        queries = []
+        for _ in range(count):
+            words = rng.choices(self.vocabulary[:2000], cum_weights=self.weights[:2000], k=rng.randint(1, 3))
+            if len(words) > 1 and rng.random() < 0.2:
+                queries.append(" OR ".join(words))
+            else:
+                queries.append(" ".join(words))
+        return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic web on localhost")
+    parser.add_argument("--pages", type=int, default=1000, help="number of HTML pages")
+    parser.add_argument("--fan-out", type=int, default=10, help="links on each page")
+    parser.add_argument("--disallowed", type=float, default=0.05, help="share of links disallowed by robots.txt")
+    parser.add_argument("--words", type=int, default=300, help="average words on a page")
+    parser.add_argument("--port", type=int, default=8765)
+    options = parser.parse_args()
+
+    web = SyntheticWeb(options.pages, options.fan_out, options.disallowed, words=options.words)
+    print(f"Serving {options.pages} pages from {web.start(port=options.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        web.stop()
+
+if __name__ == "__main__":
+    main()
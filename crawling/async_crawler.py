@@ -0,0 +1,133 @@
+import aiohttp
+import asyncio
+import random
+
+from crawling.pipeline import TOO_LARGE, fetch_failed, handle_page, handle_response, robots_allowed, valid_url
+from crawling.revisit import conditional_headers
+from crawling.robots import robots_key
+from indexing.parser import parse_page
+from monitoring.crawl import ERRORS, FETCH_SECONDS, PARSE_SECONDS, ROBOTS_SECONDS
+
+# Check robots.txt through the shared robots cache
+async def can_parse(args, session, url):
+    if not valid_url(url):
+        return robots_allowed(args, url, None)
+
+    robots = args["robots"]
+    key = robots_key(url)
+    rules = robots.lookup(key)
+    if rules is None:
+        # Workers asking for the same host share one download
+        pending = args["robots_pending"]
+        if key not in pending:
+            pending[key] = asyncio.ensure_future(fetch_robots(session, key))
+        try:
+            status, text = await asyncio.shield(pending[key])
+        finally:
+            pending.pop(key, None)
+        rules = robots.update(key, status, text)
+    return robots_allowed(args, url, rules)
+
+async def fetch_robots(session, key):
+    robots_url = f"{key}/robots.txt"
+    try:
+        async with session.get(robots_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            return response.status, await response.text(errors="replace")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Failed to access robots.txt: {robots_url}")
+        print(f"Error: {e}")
+        return None, None
+
+# Streams the body over the shared session and gives up once it passes max_bytes
+# previous makes the request conditional, see crawling.pipeline for what is returned
+async def fetch_page(args, session, url, previous=None):
+    max_bytes = args["max_bytes"]
+    headers = {'User-Agent': random.choice(args["headers"])}
+    headers.update(conditional_headers(previous))
+    async with session.get(url, headers=headers) as response:
+        response.raise_for_status()
+        validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        content_type = response.headers.get('Content-Type', '').lower()
+        if response.status == 304 or not content_type.startswith('text/html'):
+            return response.status, content_type, None, validators
+        if response.content_length is not None and response.content_length > max_bytes:
+            return response.status, content_type + TOO_LARGE, None, validators
+
+        content = bytearray()
+        async for chunk in response.content.iter_chunked(65536):
+            content.extend(chunk)
+            if len(content) > max_bytes:
+                return response.status, content_type + TOO_LARGE, None, validators
+        return response.status, content_type, bytes(content), validators
+
+async def crawl_url(args, session, current_url, depth):
+    with ROBOTS_SECONDS.time():
+        allowed = await can_parse(args, session, current_url)
+    if not allowed:
+        return
+
+    # The frontier only hands out urls whose host is eligible, so fetch right away
+    previous = args["fetch_state"].get(current_url)
+    try:
+        with FETCH_SECONDS.time():
+            status, content_type, content, validators = await fetch_page(args, session, current_url, previous)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        fetch_failed(args, current_url, e)
+        return
+
+    state = handle_response(args, current_url, status, content_type, content, validators, previous)
+    if state is None:
+        return
+
+    # Parsing runs in the process pool so the event loop keeps fetching
+    # Without a parse pool pages are parsed in the default thread pool
+    parse_arguments = (current_url, content, content_type, args["extractor"], args["positions"])
+    with PARSE_SECONDS.time():
+        if args["parser"] is None:
+            indexed_page = await asyncio.get_running_loop().run_in_executor(None, parse_page, *parse_arguments)
+        else:
+            indexed_page = await args["parser"].parse_async(*parse_arguments)
+    handle_page(args, current_url, depth, indexed_page, previous, state)
+
+async def worker(args, session):
+    frontier = args["frontier"]
+    errors = args["errors"]
+
+    while not args["stop_crawl"].is_set():
+        item = frontier.get()
+        if item is None:
+            # Nothing queued and no other worker can add more links
+            if frontier.finished():
+                args["stop_crawl"].set()
+                break
+            wait = frontier.wait_time()
+            await asyncio.sleep(min(wait if wait is not None else 0.1, 0.5))
+            continue
+        url, depth = item
+
+        try:
+            await crawl_url(args, session, url, depth)
+        except Exception as e:
+            errors[0] += 1
+            ERRORS.inc()
+            print(f"Error: {e}")
+        finally:
+            frontier.done(url)
+
+async def run(args):
+    args["stop_crawl"] = asyncio.Event()
+    args["robots_pending"] = {}
+
+    # One pooled session for every request, per host limits come from the frontier
+    connector = aiohttp.TCPConnector(limit=args["concurrency"], ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=20)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        workers = [asyncio.create_task(worker(args, session)) for _ in range(args["concurrency"])]
+        await asyncio.gather(*workers)
+
+    print(f"Errors: {args['errors'][0]}")
+
+# Crawl with one event loop instead of a pool of threads
+# Urls left in the frontier are not crawled this session
+def async_crawl(args):
+    asyncio.run(run(args))
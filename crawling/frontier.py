@@ -0,0 +1,144 @@
+from urllib.parse import urlparse
+import heapq
+import itertools
+import threading
+import time
+
+# Crawl frontier with one queue per host
+# A heap of (ready time, host) hands out the next url whose host may be fetched,
+# so a slow or busy host never holds up the others
+class Frontier:
+    def __init__(self, delay=2.0, concurrency=1, priority="depth"):
+        # Default politeness for every host, override with set_delay/set_concurrency
+        self.delay = delay
+        self.concurrency = concurrency
+        # "depth" crawls shallow pages first, "rank" crawls pages with the highest estimated pagerank first
+        self.priority = priority
+        self.host_delays = {}
+        self.host_concurrency = {}
+
+        self.queues = {}
+        self.queued = set()
+        self.active = {}
+        self.next_time = {}
+        self.ready = []
+        self.scheduled = set()
+        self.in_flight = 0
+        # Urls handed out and not given back yet, with their depth and score
+        self.taken = {}
+        # State of every url changed since the last checkpoint, see checkpoint()
+        self.changes = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def set_delay(self, host, delay):
+        with self.lock:
+            self.host_delays[host] = delay
+
+    def set_concurrency(self, host, concurrency):
+        with self.lock:
+            self.host_concurrency[host] = concurrency
+            self._schedule(host)
+
+    # not_before keeps the host waiting until then, used when resuming a saved frontier
+    def put(self, url, depth=0, score=0.0, not_before=0.0):
+        host = urlparse(url).netloc
+        if self.priority == "rank":
+            key = -score
+        else:
+            key = depth
+
+        with self.lock:
+            if url in self.queued:
+                return False
+            self.queued.add(url)
+            heapq.heappush(self.queues.setdefault(host, []), (key, next(self.counter), url, depth, score))
+            if not_before > self.next_time.get(host, 0):
+                self.next_time[host] = not_before
+            self.changes[url] = ("queued", depth, score, self.next_time.get(host, 0))
+            self._schedule(host)
+        return True
+
+    # Returns (url, depth) of the next url that can be fetched now, or None
+    # Every url handed out must be given back with done() once it is fetched
+    def get(self):
+        now = time.time()
+        with self.lock:
+            while self.ready and self.ready[0][0] <= now:
+                _, host = heapq.heappop(self.ready)
+                self.scheduled.discard(host)
+                queue = self.queues.get(host)
+                if not queue or self.active.get(host, 0) >= self._limit(host):
+                    continue
+                if self.next_time.get(host, 0) > now:
+                    # The host was pushed back after it was scheduled
+                    heapq.heappush(self.ready, (self.next_time[host], host))
+                    self.scheduled.add(host)
+                    continue
+
+                _, _, url, depth, score = heapq.heappop(queue)
+                if not queue:
+                    del self.queues[host]
+                self.queued.discard(url)
+                self.active[host] = self.active.get(host, 0) + 1
+                self.in_flight += 1
+                self.next_time[host] = now + self.host_delays.get(host, self.delay)
+                self.taken[url] = (depth, score)
+                self.changes[url] = ("in_progress", depth, score, now)
+                self._schedule(host)
+                return url, depth
+        return None
+
+    # The writer marks a url as done when its page is stored,
+    # until then it goes back to queued so a stopped crawl picks it up again
+    def done(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            depth, score = self.taken.pop(url)
+            self.changes[url] = ("queued", depth, score, self.next_time.get(host, 0))
+            self.active[host] -= 1
+            if self.active[host] == 0:
+                del self.active[host]
+            self.in_flight -= 1
+            self._schedule(host)
+
+    # Queue a url that was handed out again, with its depth and score, no earlier than not_before
+    # done() still has to be called for it
+    def requeue(self, url, not_before):
+        with self.lock:
+            depth, score = self.taken[url]
+        self.put(url, depth, score, not_before)
+
+    # Seconds until the next host becomes eligible, None if nothing is waiting
+    def wait_time(self):
+        with self.lock:
+            if not self.ready:
+                return None
+            return max(0.0, self.ready[0][0] - time.time())
+
+    # Nothing is queued and no worker is fetching, so no new urls can show up
+    def finished(self):
+        with self.lock:
+            return not self.queued and self.in_flight == 0
+
+    # Returns {url: (state, depth, score, next eligible time)} changed since the last call
+    def checkpoint(self):
+        with self.lock:
+            changes = self.changes
+            self.changes = {}
+        return changes
+
+    def __len__(self):
+        return len(self.queued)
+
+    def _limit(self, host):
+        return self.host_concurrency.get(host, self.concurrency)
+
+    # Put a host on the ready heap if it has urls and a free slot
+    def _schedule(self, host):
+        if host in self.scheduled or not self.queues.get(host):
+            return
+        if self.active.get(host, 0) >= self._limit(host):
+            return
+        heapq.heappush(self.ready, (self.next_time.get(host, 0), host))
+        self.scheduled.add(host)
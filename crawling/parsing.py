@@ -0,0 +1,49 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import threading
+
+from indexing.parser import parse_page
+from monitoring.crawl import PARSE_POOL_RESTARTS
+
+# Process pool the crawl workers parse pages in, started again when one of its processes dies
+# A dead process breaks the whole pool, so without a new one every later page would fail to parse
+class ParsePool:
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor = self.start()
+
+    # Spawned instead of forked because the crawl already runs threads
+    def start(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # Every worker that was waiting on the broken pool sees the error, only the first one replaces it
+    def restart(self, broken):
+        with self.lock:
+            if self.executor is broken:
+                print("A parse process died, starting a new parse pool")
+                PARSE_POOL_RESTARTS.inc()
+                broken.shutdown(wait=False)
+                self.executor = self.start()
+            return self.executor
+
+    # Pages are retried once in the new pool, a page that breaks that one too fails like any other error
+    def parse(self, *arguments):
+        executor = self.executor
+        try:
+            return executor.submit(parse_page, *arguments).result()
+        except BrokenProcessPool:
+            return self.restart(executor).submit(parse_page, *arguments).result()
+
+    async def parse_async(self, *arguments):
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, parse_page, *arguments)
+        except BrokenProcessPool:
+            return await loop.run_in_executor(self.restart(executor), parse_page, *arguments)
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,134 @@
+from urllib.parse import urlparse
+import time
+
+from crawling.revisit import next_interval, revisit
+from monitoring.crawl import FETCHED_BYTES, LOCK_WAIT_SECONDS, PAGES
+from monitoring.metrics import timed_lock
+
+# What the crawler does with a url, shared by the thread and the asyncio crawl modes
+# The modes only differ in how they download robots.txt and pages and where they parse,
+# their fetch_page returns (status, content type, content, (etag, last modified)),
+# content is None for non-HTML and oversized pages and for 304 Not Modified,
+# the content type of an oversized page ends with TOO_LARGE
+TOO_LARGE = "; too large"
+
+# Times the robots.txt failure of a host is waited out before its urls are left for the next crawl
+ROBOTS_RETRIES = 1
+
+# Invalid and non-HTTP urls are never fetched
+def valid_url(url):
+    parsed_url = urlparse(url)
+
+    if not parsed_url.scheme or not parsed_url.netloc:
+        print(f"Invalid URL format: {url}")
+        return False
+
+    # Only process HTTP/HTTPS URLs
+    if parsed_url.scheme not in ('http', 'https'):
+        print(f"Skipping non-HTTP URL: {url}")
+        return False
+    return True
+
+# Whether the robots.txt rules of the url's host let the crawler fetch it, rules is None for invalid urls
+# Urls that may not be fetched are blocked, unless they are indexed already
+def robots_allowed(args, url, rules):
+    if rules is not None and rules.unavailable:
+        wait_for_robots(args, url)
+        return False
+
+    if rules is not None:
+        # Slow down for hosts that ask for it
+        frontier = args["frontier"]
+        if rules.crawl_delay is not None and rules.crawl_delay > frontier.delay:
+            frontier.set_delay(urlparse(url).netloc, rules.crawl_delay)
+
+        if rules.allowed(url):
+            return True
+        print(f"DISALLOWED: {url}")
+
+    PAGES.inc(result="disallowed")
+    if url not in args["fetch_state"]:
+        block_url(args, url)
+    return False
+
+# The host's robots.txt failed to download, so the url is tried again once the cached failure expires
+# Urls of a host that has been failing for longer stay queued in FRONTIER for the next crawl
+def wait_for_robots(args, url):
+    PAGES.inc(result="robots_unavailable")
+    negative_ttl = args["robots"].negative_ttl
+    now = time.time()
+    first_failure = args["robots_waits"].setdefault(urlparse(url).netloc, now)
+    if now - first_failure >= ROBOTS_RETRIES * negative_ttl:
+        print(f"robots.txt still unavailable, leaving {url} for the next crawl")
+        return
+    print(f"robots.txt unavailable, trying {url} again later")
+    args["frontier"].requeue(url, now + negative_ttl)
+
+def block_url(args, url):
+    args["blocked"].add(url)
+    args["writer"].block(url)
+
+def fetch_failed(args, url, error):
+    print(f"Failed to retrieve {url}: {error}")
+    PAGES.inc(result="failed")
+    # A page that is already indexed keeps its old version until the next recrawl
+    if url not in args["fetch_state"]:
+        block_url(args, url)
+
+# Store what a fetch found out about a page, previous is the fetch state of an earlier visit
+# Returns the fetch state to store with the page when it has to be parsed and indexed, otherwise None
+def handle_response(args, url, status, content_type, content, validators, previous):
+    writer = args["writer"]
+    if content is not None:
+        FETCHED_BYTES.inc(len(content))
+
+    # Nothing to index again when the server or the content hash says the page did not change
+    # The state of a changed page is written with the page, so a page that is not indexed after all is fetched again
+    state = None
+    if status == 304 or content is not None:
+        state, changed = revisit(previous, validators, content)
+        if not changed:
+            writer.fetched(url, state)
+            PAGES.inc(result="unchanged")
+            return None
+
+    # Insert non-HTML and oversized pages into urls without indexing them
+    if content is None:
+        if content_type.endswith(TOO_LARGE):
+            # Oversized pages keep a fetch state so recrawls check whether they shrank or the limit was raised,
+            # without a content hash the next download that fits is indexed
+            PAGES.inc(result="too_large")
+            interval = previous[3] if previous is not None else None
+            writer.non_html(url, content_type, (*validators, None, time.time(), next_interval(interval, False)))
+            return None
+        PAGES.inc(result="non_html")
+        writer.non_html(url, content_type)
+        return None
+    return state
+
+# Queue the links of a parsed page and hand the page to the writer with its fetch state
+def handle_page(args, url, depth, indexed_page, previous, state):
+    frontier = args["frontier"]
+    writer = args["writer"]
+
+    # A page visited before drops the links stored by that visit
+    links = [link for link in indexed_page["links"] if link not in args["blocked"]]
+    writer.links(url, links, previous is not None)
+
+    # Each link gets an equal share of the current page's rank as its estimated rank
+    # Only urls that were never queued, crawled or blocked go to the frontier
+    score = args["ranks"].get(url, 0.0) / max(len(links), 1)
+    for link in links:
+        if args["seen"].add(link):
+            frontier.put(link, depth + 1, score)
+
+    with timed_lock(args["lock"], LOCK_WAIT_SECONDS, lock="count"):
+        args["count"][0] += 1
+        if args["count"][0] > args["max_urls"]:
+            print("Crawl limit reached. Exiting...")
+            args["stop_crawl"].set()
+            return
+
+    # Store url information, images and words through the writer
+    writer.page(url, indexed_page, indexed_page["images"], state)
+    PAGES.inc(result="indexed")
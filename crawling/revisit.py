@@ -0,0 +1,48 @@
+import hashlib
+import time
+
+# Revisit scheduling for recrawls
+# Every fetched page keeps its validators, a hash of its content and a revisit interval in FETCH_STATE,
+# pages that change get visited more often and pages that don't less often
+
+DEFAULT_INTERVAL = 24 * 3600
+MIN_INTERVAL = 3600
+MAX_INTERVAL = 30 * 24 * 3600
+
+def content_hash(content):
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+# Headers that let the server answer 304 Not Modified
+# previous is (etag, last modified, content hash, interval) from the last fetch, or None
+def conditional_headers(previous):
+    headers = {}
+    if previous is None:
+        return headers
+    etag, last_modified = previous[0], previous[1]
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+# Halve the interval when the page changed, stretch it when it didn't
+def next_interval(interval, changed):
+    if interval is None:
+        return DEFAULT_INTERVAL
+    if changed:
+        return max(MIN_INTERVAL, interval / 2)
+    return min(MAX_INTERVAL, interval * 1.5)
+
+# Fetch state to store for a page and whether it has to be indexed again
+# content is None when the server answered 304
+def revisit(previous, validators, content):
+    etag, last_modified = validators
+    if previous is None:
+        digest = content_hash(content)
+        return (etag, last_modified, digest, time.time(), DEFAULT_INTERVAL), True
+
+    old_etag, old_last_modified, old_digest, interval = previous
+    digest = old_digest if content is None else content_hash(content)
+    changed = old_digest is None or digest != old_digest
+    state = (etag or old_etag, last_modified or old_last_modified, digest, time.time(), next_interval(interval, changed))
+    return state, changed
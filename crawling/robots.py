@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+import math
+import re
+import threading
+import time
+
+# Product token matched against the User-agent lines of robots.txt
+ROBOTS_AGENT = "CrustSearch"
+# Longest Crawl-delay honoured in seconds, longer ones would keep a host's urls queued for the whole crawl
+MAX_CRAWL_DELAY = 60.0
+
+# Rules of one robots.txt for our user agent (RFC 9309)
+class RobotsRules:
+    # unavailable means robots.txt could not be read, nothing may be fetched until it can
+    def __init__(self, rules=None, crawl_delay=None, unavailable=False):
+        # List of (pattern length, allow, compiled pattern)
+        self.rules = rules or []
+        self.crawl_delay = crawl_delay
+        self.unavailable = unavailable
+
+    @classmethod
+    def parse(cls, text, agent=ROBOTS_AGENT):
+        agent = agent.lower()
+        groups = []
+        current = None
+        in_rules = False
+
+        for line in text.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            key = key.strip().lower()
+            value = value.strip()
+
+            if key == "user-agent":
+                # A user-agent line after rules starts a new group
+                if current is None or in_rules:
+                    current = {"agents": [], "rules": [], "crawl_delay": None}
+                    groups.append(current)
+                    in_rules = False
+                current["agents"].append(value.lower())
+            elif current is None:
+                continue
+            elif key in ("allow", "disallow"):
+                in_rules = True
+                # An empty disallow allows everything, so it is not a rule
+                if value:
+                    current["rules"].append((key == "allow", value))
+            elif key == "crawl-delay":
+                in_rules = True
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                # "inf", "nan" and negative delays are ignored
+                if math.isfinite(delay) and delay >= 0:
+                    current["crawl_delay"] = min(delay, MAX_CRAWL_DELAY)
+
+        # Use every group naming our agent, otherwise every "*" group
+        matched = [group for group in groups if agent in group["agents"]]
+        if not matched:
+            matched = [group for group in groups if "*" in group["agents"]]
+
+        rules = []
+        crawl_delay = None
+        for group in matched:
+            for allow, pattern in group["rules"]:
+                rules.append((len(pattern), allow, compile_pattern(pattern)))
+            if group["crawl_delay"] is not None:
+                crawl_delay = group["crawl_delay"]
+        return cls(rules, crawl_delay)
+
+    def allowed(self, url):
+        if self.unavailable:
+            return False
+
+        parsed_url = urlparse(url)
+        path = normalize_path(parsed_url.path or "/")
+        if parsed_url.query:
+            path += "?" + parsed_url.query
+        if path == "/robots.txt":
+            return True
+
+        # The longest matching pattern wins and allow wins a tie
+        best_length = -1
+        best_allow = True
+        for length, allow, pattern in self.rules:
+            if pattern.match(path) and (length > best_length or (length == best_length and allow)):
+                best_length = length
+                best_allow = allow
+        return best_allow
+
+# "*" matches any characters and a trailing "$" anchors the end of the path
+def compile_pattern(pattern):
+    pattern = normalize_path(pattern)
+    anchored = pattern.endswith("$")
+    if anchored:
+        pattern = pattern[:-1]
+    regex = ".*".join(re.escape(part) for part in pattern.split("*"))
+    return re.compile(regex + ("$" if anchored else ""))
+
+# Decode percent-encoding so paths and patterns compare the same way
+def normalize_path(path):
+    return unquote(path)
+
+def robots_key(url):
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme.lower()}://{parsed_url.netloc.lower()}"
+
+# robots.txt per scheme and host, shared by every worker
+# fetch(robots_url) returns (status code, text), or (None, None) when the host is unreachable
+class RobotsCache:
+    def __init__(self, fetch=None, agent=ROBOTS_AGENT, ttl=24 * 60 * 60, negative_ttl=10 * 60, max_hosts=10000):
+        self.fetch = fetch
+        self.agent = agent
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_hosts = max_hosts
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    # Cached rules for a key, None if missing or expired
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            rules, expires = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return rules
+
+    # Build the rules for a fetch result and cache them
+    def update(self, key, status, text):
+        if status is not None and 200 <= status < 300:
+            rules = RobotsRules.parse(text or "", self.agent)
+            ttl = self.ttl
+        elif status is not None and 400 <= status < 500:
+            # robots.txt is unavailable, so everything is allowed
+            rules = RobotsRules()
+            ttl = self.ttl
+        else:
+            # Server errors and network failures make the host unavailable for a short while
+            rules = RobotsRules(unavailable=True)
+            ttl = self.negative_ttl
+
+        with self.lock:
+            self.entries[key] = (rules, time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_hosts:
+                self.entries.popitem(last=False)
+        return rules
+
+    # Rules for the host of a url, fetching robots.txt at most once at a time per host
+    def get(self, url):
+        key = robots_key(url)
+        rules = self.lookup(key)
+        if rules is not None:
+            return rules
+
+        with self.lock:
+            event = self.pending.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self.pending[key] = event
+
+        if not owner:
+            # Another worker is fetching this robots.txt already
+            event.wait()
+            rules = self.lookup(key)
+            if rules is not None:
+                return rules
+
+        try:
+            status, text = self.fetch(f"{key}/robots.txt")
+            return self.update(key, status, text)
+        finally:
+            if owner:
+                with self.lock:
+                    del self.pending[key]
+                event.set()
+
+    def allowed(self, url):
+        return self.get(url).allowed(url)
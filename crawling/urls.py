@@ -0,0 +1,118 @@
+from urllib.parse import unquote_plus, urljoin, urlsplit, urlunsplit
+import hashlib
+import math
+import posixpath
+import threading
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = {"gclid", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_hsenc", "_hsmi"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# One spelling for every url that points at the same page, None for anything that is not http(s)
+# base resolves relative links the way a browser would
+def canonicalize(url, base=None):
+    url = url.strip()
+    if base is not None:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower()
+    if ":" in host:
+        host = f"[{host}]"
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+    if "." in path:
+        # Resolve "." and ".." segments but keep a trailing slash
+        normalized = posixpath.normpath(path)
+        if path.endswith("/") and normalized != "/":
+            normalized += "/"
+        path = "/" + normalized.lstrip("/")
+
+    # The "key=value" pieces are kept as they were written, decoding and encoding them again
+    # would turn "?q" into "?q=" and "%20" into "+", which some servers treat as another page
+    # Sorting by key only keeps the order of repeated keys
+    query = [piece for piece in parts.query.split("&") if piece and not is_tracking(piece)]
+    query.sort(key=lambda piece: piece.partition("=")[0])
+
+    return urlunsplit((scheme, host, path, "&".join(query), ""))
+
+def is_tracking(piece):
+    key = unquote_plus(piece.partition("=")[0]).lower()
+    return key.startswith("utm_") or key in TRACKING_PARAMS
+
+# Urls the crawler has already queued, crawled or blocked
+# "exact" keeps every url, "bloom" keeps a fixed size bit array for crawls too large for memory
+# and skips about error_rate of the new urls once capacity urls were added
+class SeenSet:
+    def __init__(self, mode="exact", capacity=10000000, error_rate=0.001):
+        self.mode = mode
+        self.count = 0
+        self.lock = threading.Lock()
+        if mode == "bloom":
+            self.bits = BloomFilter(capacity, error_rate)
+        else:
+            self.urls = set()
+
+    # Returns True if the url was not seen before
+    def add(self, url):
+        with self.lock:
+            if self.mode == "bloom":
+                added = self.bits.add(url)
+            else:
+                added = url not in self.urls
+                self.urls.add(url)
+            if added:
+                self.count += 1
+            return added
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        if self.mode == "bloom":
+            return url in self.bits
+        return url in self.urls
+
+    def __len__(self):
+        return self.count
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # Bit positions from two halves of one digest (Kirsch-Mitzenmacher double hashing)
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    # Returns True if at least one bit was not set yet, so the key is new for sure
+    def add(self, key):
+        added = False
+        for position in self.positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, key):
+        for position in self.positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
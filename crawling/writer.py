@@ -0,0 +1,271 @@
+from queue import Queue, Empty
+import threading
+import time
+
+from indexing.simhash import bands, distance, to_signed, to_unsigned
+from monitoring.crawl import PAGES_WRITTEN, WRITE_SECONDS
+
+# Largest number of bound variables used in one "IN (...)" query
+CHUNK_SIZE = 500
+
+# Single thread that owns the sqlite connection during a crawl
+# Fetch workers hand it pages and links over a queue and never touch the db,
+# it resolves ids through in-memory caches and writes everything in large transactions
+class IndexWriter(threading.Thread):
+    # With a frontier, its changed urls are saved to FRONTIER every checkpoint_interval seconds
+    # Pages whose fingerprint is at most duplicate_distance bits from an indexed page are not indexed, None keeps them all
+    def __init__(self, connection, batch_size=50, flush_interval=2.0, frontier=None, checkpoint_interval=10.0, duplicate_distance=3):
+        super().__init__(daemon=True)
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.frontier = frontier
+        self.checkpoint_interval = checkpoint_interval
+        self.duplicate_distance = duplicate_distance
+        self.last_checkpoint = time.time()
+        # Unbounded so the asyncio crawler never blocks its event loop on a put
+        self.queue = Queue()
+        self.url_ids = {}
+        self.word_ids = {}
+        self.pages_written = 0
+        self.duplicates = 0
+
+    def block(self, url):
+        self.queue.put(("block", url))
+
+    # state is the fetch state of an oversized page, so recrawls visit it again
+    def non_html(self, url, content_type, state=None):
+        self.queue.put(("non_html", url, content_type, state))
+
+    # replace drops the links stored by an earlier visit of the source page
+    def links(self, source_url, urls, replace=False):
+        self.queue.put(("links", source_url, urls, replace))
+
+    # state is (etag, last modified, content hash, fetched at, interval), see crawling.revisit
+    def fetched(self, url, state):
+        self.queue.put(("fetched", url, state))
+
+    # state is the fetch state of the visit, stored in the same transaction as the page
+    def page(self, url, indexed_page, images, state=None):
+        self.queue.put(("page", url, indexed_page, images, state))
+
+    # Write what is left and wait for the thread to finish
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        pending = []
+        pages = 0
+        last_flush = time.time()
+
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except Empty:
+                item = ()
+
+            if item is None:
+                break
+            if item:
+                pending.append(item)
+                if item[0] == "page":
+                    pages += 1
+
+            if pending and (pages >= self.batch_size or time.time() - last_flush >= self.flush_interval):
+                with WRITE_SECONDS.time():
+                    self.flush(pending)
+                pending = []
+                pages = 0
+                last_flush = time.time()
+            elif self.checkpoint_due():
+                self.flush([])
+
+        # The last checkpoint keeps every url still queued for the next crawl
+        self.last_checkpoint = 0
+        self.flush(pending)
+
+    def checkpoint_due(self):
+        return self.frontier is not None and time.time() - self.last_checkpoint >= self.checkpoint_interval
+
+    def flush(self, items):
+        cursor = self.cursor
+        changes = {}
+        if self.checkpoint_due():
+            changes = self.frontier.checkpoint()
+            self.last_checkpoint = time.time()
+        if not items and not changes:
+            return
+
+        blocks = [item[1] for item in items if item[0] == "block"]
+        non_html = [item for item in items if item[0] == "non_html"]
+        links = [item for item in items if item[0] == "links"]
+        pages = [item for item in items if item[0] == "page"]
+        fetched = [item[1:] for item in items if item[0] == "fetched"]
+        # Pages and oversized pages carry their fetch state as the last field
+        fetched += [(item[1], item[-1]) for item in pages + non_html if item[-1] is not None]
+
+        try:
+            # Every url that shows up gets a row first so all ids can be resolved at once
+            new_urls = {url for _, _, urls, _ in links for url in urls}
+            cursor.executemany("INSERT OR IGNORE INTO URLs (url) VALUES (?)", [(url, ) for url in new_urls if url not in self.url_ids])
+            # Blocked urls never get their row back from a checkpoint
+            cursor.executemany("INSERT OR IGNORE INTO URLs (url) SELECT ? WHERE NOT EXISTS (SELECT 1 FROM BLOCKED_URLs WHERE url = ?)",
+                               [(url, url) for url in changes if url not in new_urls])
+            needed = new_urls | set(changes) | {item[1] for item in links + pages + non_html} | {url for url, _ in fetched}
+            url_ids = self.resolve_urls(needed)
+
+            # A checkpoint is written before the pages, so a page stored in the same batch ends up done,
+            # and a url whose page was stored in an earlier batch is done already
+            cursor.executemany('''INSERT INTO FRONTIER (url_id, state, depth, priority, next_eligible)
+                                  SELECT id, CASE WHEN crawled = 1 THEN 'done' ELSE ? END, ?, ?, ? FROM URLs WHERE id = ?
+                                  ON CONFLICT (url_id) DO UPDATE SET state = excluded.state, depth = excluded.depth,
+                                  priority = excluded.priority, next_eligible = excluded.next_eligible
+                                  WHERE FRONTIER.state != 'done' ''',
+                               [(state, depth, score, next_eligible, url_ids[url])
+                                for url, (state, depth, score, next_eligible) in changes.items() if url in url_ids])
+
+            connection_data = []
+            for _, source_url, urls, replace in links:
+                source_id = url_ids.get(source_url)
+                if source_id is None:
+                    continue
+                if replace:
+                    cursor.execute("DELETE FROM CONNECTIONS WHERE source_id = ?", (source_id, ))
+                connection_data.extend((source_id, url_ids[url]) for url in urls if url in url_ids)
+            cursor.executemany("INSERT OR IGNORE INTO CONNECTIONS (source_id, target_id) VALUES (?, ?)", connection_data)
+
+            cursor.executemany("UPDATE URLs SET title = ?, description = ?, crawled = 1 WHERE id = ? AND crawled = 0",
+                               [("Non-HTML", content_type, url_ids[url]) for _, url, content_type, _ in non_html if url in url_ids])
+            cursor.executemany("UPDATE FRONTIER SET state = 'done' WHERE url_id = ?",
+                               [(url_ids[url], ) for _, url, _, _ in non_html if url in url_ids])
+
+            self.write_pages(pages, url_ids)
+
+            cursor.executemany('''INSERT INTO FETCH_STATE (url_id, etag, last_modified, content_hash, fetched_at, interval, next_visit)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?)
+                                  ON CONFLICT (url_id) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified,
+                                  content_hash = excluded.content_hash, fetched_at = excluded.fetched_at,
+                                  interval = excluded.interval, next_visit = excluded.next_visit''',
+                               [(url_ids[url], etag, last_modified, digest, fetched_at, interval, fetched_at + interval)
+                                for url, (etag, last_modified, digest, fetched_at, interval) in fetched if url in url_ids])
+
+            self.remove_urls(blocks)
+
+            # Tell the search server its cached results are stale
+            if items:
+                cursor.execute("INSERT INTO SCORE_STATE (name, value) VALUES ('generation', 1) ON CONFLICT (name) DO UPDATE SET value = value + 1")
+
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            # Ids resolved inside the failed transaction are gone
+            self.url_ids.clear()
+            self.word_ids.clear()
+            print(f"Error writing batch: {e}")
+
+    def write_pages(self, pages, url_ids):
+        cursor = self.cursor
+
+        # Near-duplicates of an indexed page are stored without postings or images
+        # Pages are checked one by one, so a duplicate within the same batch is found too
+        indexed = []
+        url_data = []
+        for _, url, indexed_page, images, _ in pages:
+            url_id = url_ids.get(url)
+            if url_id is None:
+                continue
+            if self.is_duplicate(url_id, indexed_page.get("fingerprint")):
+                url_data.append((indexed_page["title"], indexed_page["description"], 0, url_id))
+                self.duplicates += 1
+            else:
+                indexed.append((url_id, indexed_page, images))
+
+        words = {word for _, indexed_page, _ in indexed for word in indexed_page["filtered_words"]}
+        word_ids = self.resolve_words(words)
+
+        image_data = []
+        postings = []
+        for url_id, indexed_page, images in indexed:
+            filtered_words = indexed_page["filtered_words"]
+            positions = indexed_page.get("positions", {})
+            url_data.append((indexed_page["title"], indexed_page["description"], len(filtered_words), url_id))
+            image_data.extend(images)
+            postings.extend((word_ids[word], url_id, frequency, positions.get(word)) for word, frequency in filtered_words.items())
+
+        # A page indexed again drops its old postings, their words need new document frequencies
+        page_ids = [(url_id, ) for *_, url_id in url_data]
+        cursor.executemany("INSERT OR IGNORE INTO DIRTY_WORDS (word_id) SELECT word_id FROM INVERTED_INDEX WHERE page_id = ?", page_ids)
+        cursor.executemany("DELETE FROM INVERTED_INDEX WHERE page_id = ?", page_ids)
+
+        cursor.executemany("INSERT OR IGNORE INTO IMAGES (image, title, alt, source_url, context) VALUES (?, ?, ?, ?, ?)", image_data)
+        cursor.executemany("UPDATE URLs SET title = ?, description = ?, word_count = ?, crawled = 1 WHERE id = ?", url_data)
+        cursor.executemany("UPDATE FRONTIER SET state = 'done' WHERE url_id = ?", page_ids)
+        cursor.executemany('''INSERT INTO INVERTED_INDEX (word_id, page_id, frequency, positions) VALUES (?, ?, ?, ?)
+                              ON CONFLICT DO UPDATE SET frequency = excluded.frequency, positions = excluded.positions''', postings)
+
+        # Remember what changed for the next incremental ranking run
+        cursor.executemany("INSERT OR IGNORE INTO DIRTY_PAGES (page_id) VALUES (?)", page_ids)
+        cursor.executemany("INSERT OR IGNORE INTO DIRTY_WORDS (word_id) VALUES (?)", [(word_ids[word], ) for word in words])
+        self.pages_written += len(url_data)
+        PAGES_WRITTEN.inc(len(url_data))
+
+    # Blocked urls lose their row and everything stored about them, their words need new document frequencies
+    # Pages that were collapsed into a removed page are no longer near-duplicates of anything
+    def remove_urls(self, urls):
+        cursor = self.cursor
+        cursor.executemany("INSERT OR IGNORE INTO BLOCKED_URLs (url) VALUES (?)", [(url, ) for url in urls])
+        url_ids = [(url_id, ) for url_id in self.resolve_urls(urls).values()]
+
+        cursor.executemany("INSERT OR IGNORE INTO DIRTY_WORDS (word_id) SELECT word_id FROM INVERTED_INDEX WHERE page_id = ?", url_ids)
+        cursor.executemany("DELETE FROM INVERTED_INDEX WHERE page_id = ?", url_ids)
+        cursor.executemany("DELETE FROM CONNECTIONS WHERE source_id = ? OR target_id = ?", [(url_id, url_id) for url_id, in url_ids])
+        cursor.executemany("UPDATE FINGERPRINTS SET canonical_id = NULL WHERE canonical_id = ?", url_ids)
+        for table in ("FETCH_STATE", "FINGERPRINTS", "RANKS", "FRONTIER"):
+            cursor.executemany(f"DELETE FROM {table} WHERE url_id = ?", url_ids)
+        cursor.executemany("DELETE FROM DIRTY_PAGES WHERE page_id = ?", url_ids)
+        cursor.executemany("DELETE FROM IMAGES WHERE source_url = ?", [(url, ) for url in urls])
+        cursor.executemany("DELETE FROM URLs WHERE id = ?", url_ids)
+        for url in urls:
+            self.url_ids.pop(url, None)
+
+    # Store the fingerprint of a page, True if an indexed page is at most duplicate_distance bits away
+    def is_duplicate(self, url_id, fingerprint):
+        if fingerprint is None or self.duplicate_distance is None:
+            self.cursor.execute("DELETE FROM FINGERPRINTS WHERE url_id = ?", (url_id, ))
+            return False
+
+        page_bands = bands(fingerprint)
+        self.cursor.execute('''SELECT url_id, fingerprint FROM FINGERPRINTS
+                               WHERE (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)
+                               AND canonical_id IS NULL AND url_id != ?''', (*page_bands, url_id))
+        canonical_id = None
+        best = self.duplicate_distance + 1
+        for other_id, other in self.cursor.fetchall():
+            other_distance = distance(fingerprint, to_unsigned(other))
+            if other_distance < best:
+                canonical_id, best = other_id, other_distance
+
+        self.cursor.execute('''INSERT OR REPLACE INTO FINGERPRINTS (url_id, fingerprint, band0, band1, band2, band3, canonical_id)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)''', (url_id, to_signed(fingerprint), *page_bands, canonical_id))
+        return canonical_id is not None
+
+    def resolve_urls(self, urls):
+        return self.resolve(urls, self.url_ids, "SELECT url, id FROM URLs WHERE url IN ({})")
+
+    def resolve_words(self, words):
+        missing = [word for word in words if word not in self.word_ids]
+        self.cursor.executemany("INSERT OR IGNORE INTO WORDS (word) VALUES (?)", [(word, ) for word in missing])
+        return self.resolve(words, self.word_ids, "SELECT word, id FROM WORDS WHERE word IN ({})")
+
+    # Look ids up in the cache and query the missing ones in chunks
+    def resolve(self, keys, cache, query):
+        missing = [key for key in keys if key not in cache]
+        for start in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[start:start + CHUNK_SIZE]
+            bindings = ", ".join(["?"] * len(chunk))
+            self.cursor.execute(query.format(bindings), chunk)
+            for key, key_id in self.cursor.fetchall():
+                cache[key] = key_id
+        return {key: cache[key] for key in keys if key in cache}
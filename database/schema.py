@@ -0,0 +1,239 @@
+import sqlite3
+
+# Schema of search.db, shared by the crawler, the ranker and the search server
+# Every change to the schema is a new function at the end of MIGRATIONS, the version a database
+# is at is kept in PRAGMA user_version, so each migration runs exactly once per database
+
+# Applied to every connection
+PRAGMAS = [
+    # Safe with WAL, commits no longer wait for a sync of the database file
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    # 64 MB page cache and 256 MB of the file memory-mapped
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+    # Wait for a writer instead of failing with "database is locked"
+    "PRAGMA busy_timeout = 5000"
+]
+
+# Open search.db, migrate brings the schema up to date
+def connect(path="search.db", migrate=True):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    cursor = connection.cursor()
+
+    if migrate:
+        # WAL lets the search server read while the crawler writes, the mode stays set in the file
+        cursor.execute("PRAGMA journal_mode = WAL")
+    for pragma in PRAGMAS:
+        cursor.execute(pragma)
+    if migrate:
+        upgrade(connection)
+
+    return connection, cursor
+
+def schema_version(cursor):
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+# Run the migrations a database has not seen yet, each one in its own transaction
+def upgrade(connection):
+    cursor = connection.cursor()
+    version = schema_version(cursor)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    if version < len(MIGRATIONS):
+        print(f"Database schema upgraded from version {version} to {len(MIGRATIONS)}")
+
+# Version 1: the tables as main.db_connect created them
+# Uses IF NOT EXISTS so databases from before versioning pass through it unchanged
+def create_tables(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS URLs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        url TEXT UNIQUE NOT NULL,
+                        title TEXT,
+                        description TEXT,
+                        word_count INTEGER,
+                        final_rank REAL DEFAULT NULL,
+                        crawled BOOLEAN DEFAULT 0
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS WORDS (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        word TEXT UNIQUE NOT NULL
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS IMAGES (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        title TEXT,
+                        alt TEXT,
+                        context TEXT,
+                        source_url INTEGER NOT NULL,
+                        image TEXT UNIQUE NOT NULL,
+                        FOREIGN KEY (source_url) REFERENCES URLs(id)
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS INVERTED_INDEX (
+                        word_id INTEGER NOT NULL,
+                        page_id INTEGER NOT NULL,
+                        frequency INTEGER DEFAULT 1,
+                        score DEFAULT NULL,
+                        UNIQUE (word_id, page_id),
+                        FOREIGN KEY (word_id) REFERENCES WORDS(id),
+                        FOREIGN KEY (page_id) REFERENCES URLs(id)
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS BLOCKED_URLs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        url TEXT UNIQUE NOT NULL
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS CONNECTIONS (
+                        source_id INTEGER NOT NULL,
+                        target_id INTEGER NOT NULL,
+                        FOREIGN KEY (source_id) REFERENCES URLs(id),
+                        FOREIGN KEY (target_id) REFERENCES URLs(id)
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS RANKS (
+                        url_id INTEGER UNIQUE NOT NULL,
+                        rank REAL NOT NULL,
+                        FOREIGN KEY (url_id) REFERENCES URLs(id)
+                   )''')
+    create_image_index(cursor)
+    # Bookkeeping for incremental ranking runs
+    cursor.execute('''CREATE TABLE IF NOT EXISTS WORD_STATS (
+                        word_id INTEGER PRIMARY KEY,
+                        doc_freq INTEGER NOT NULL,
+                        FOREIGN KEY (word_id) REFERENCES WORDS(id)
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS SCORE_STATE (
+                        name TEXT PRIMARY KEY,
+                        value REAL
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS DIRTY_PAGES (
+                        page_id INTEGER PRIMARY KEY,
+                        FOREIGN KEY (page_id) REFERENCES URLs(id)
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS DIRTY_WORDS (
+                        word_id INTEGER PRIMARY KEY,
+                        FOREIGN KEY (word_id) REFERENCES WORDS(id)
+                    )''')
+    # Crawl frontier saved by the writer's checkpoints, state is queued, in_progress, done or failed
+    cursor.execute('''CREATE TABLE IF NOT EXISTS FRONTIER (
+                        url_id INTEGER PRIMARY KEY,
+                        state TEXT NOT NULL DEFAULT 'queued',
+                        priority REAL DEFAULT 0,
+                        depth INTEGER DEFAULT 0,
+                        next_eligible REAL DEFAULT 0,
+                        retries INTEGER DEFAULT 0,
+                        FOREIGN KEY (url_id) REFERENCES URLs(id)
+                    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS FRONTIER_STATE ON FRONTIER (state)")
+    # Validators, content hash and revisit schedule of every fetched page
+    cursor.execute('''CREATE TABLE IF NOT EXISTS FETCH_STATE (
+                        url_id INTEGER PRIMARY KEY,
+                        etag TEXT,
+                        last_modified TEXT,
+                        content_hash TEXT,
+                        fetched_at REAL,
+                        interval REAL,
+                        next_visit REAL,
+                        FOREIGN KEY (url_id) REFERENCES URLs(id)
+                    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS FETCH_STATE_NEXT_VISIT ON FETCH_STATE (next_visit)")
+    # A page indexed again replaces its postings and links, found through these
+    cursor.execute("CREATE INDEX IF NOT EXISTS INVERTED_INDEX_PAGE ON INVERTED_INDEX (page_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS CONNECTIONS_SOURCE ON CONNECTIONS (source_id)")
+    # SimHash of every indexed page, split in 4 bands that are looked up separately
+    # canonical_id is the page a near-duplicate was collapsed into
+    cursor.execute('''CREATE TABLE IF NOT EXISTS FINGERPRINTS (
+                        url_id INTEGER PRIMARY KEY,
+                        fingerprint INTEGER NOT NULL,
+                        band0 INTEGER NOT NULL,
+                        band1 INTEGER NOT NULL,
+                        band2 INTEGER NOT NULL,
+                        band3 INTEGER NOT NULL,
+                        canonical_id INTEGER,
+                        FOREIGN KEY (url_id) REFERENCES URLs(id),
+                        FOREIGN KEY (canonical_id) REFERENCES URLs(id)
+                    )''')
+    for band in range(4):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS FINGERPRINTS_BAND{band} ON FINGERPRINTS (band{band})")
+
+# Full-text index over the alt, title and context of images, kept in sync by triggers
+def create_image_index(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'IMAGES_FTS'")
+    exists = cursor.fetchone() is not None
+
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS IMAGES_FTS USING fts5(
+                            alt,
+                            title,
+                            context,
+                            content='IMAGES',
+                            content_rowid='id',
+                            tokenize='porter unicode61'
+                        )''')
+    except sqlite3.OperationalError as e:
+        print(f"Image search falls back to LIKE, FTS5 is not available: {e}")
+        return
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS IMAGES_FTS_INSERT AFTER INSERT ON IMAGES BEGIN
+                        INSERT INTO IMAGES_FTS (rowid, alt, title, context) VALUES (new.id, new.alt, new.title, new.context);
+                    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS IMAGES_FTS_DELETE AFTER DELETE ON IMAGES BEGIN
+                        INSERT INTO IMAGES_FTS (IMAGES_FTS, rowid, alt, title, context) VALUES ('delete', old.id, old.alt, old.title, old.context);
+                    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS IMAGES_FTS_UPDATE AFTER UPDATE ON IMAGES BEGIN
+                        INSERT INTO IMAGES_FTS (IMAGES_FTS, rowid, alt, title, context) VALUES ('delete', old.id, old.alt, old.title, old.context);
+                        INSERT INTO IMAGES_FTS (rowid, alt, title, context) VALUES (new.id, new.alt, new.title, new.context);
+                    END''')
+
+    # Index the images crawled before the index existed
+    if not exists:
+        cursor.execute("INSERT INTO IMAGES_FTS (IMAGES_FTS) VALUES ('rebuild')")
+
+# Version 2: covering indexes and deduplicated edges
+def add_indexes(cursor):
+    # Postings clustered by (word, page), so a word's postings are one range scan with every column in it
+    cursor.execute('''CREATE TABLE INVERTED_INDEX_NEW (
+                        word_id INTEGER NOT NULL,
+                        page_id INTEGER NOT NULL,
+                        frequency INTEGER DEFAULT 1,
+                        score REAL DEFAULT NULL,
+                        PRIMARY KEY (word_id, page_id),
+                        FOREIGN KEY (word_id) REFERENCES WORDS(id),
+                        FOREIGN KEY (page_id) REFERENCES URLs(id)
+                    ) WITHOUT ROWID''')
+    cursor.execute("INSERT INTO INVERTED_INDEX_NEW SELECT word_id, page_id, frequency, score FROM INVERTED_INDEX")
+    cursor.execute("DROP TABLE INVERTED_INDEX")
+    cursor.execute("ALTER TABLE INVERTED_INDEX_NEW RENAME TO INVERTED_INDEX")
+    cursor.execute("CREATE INDEX INVERTED_INDEX_PAGE ON INVERTED_INDEX (page_id)")
+
+    # One row per edge, earlier crawls stored the same link again on every visit
+    cursor.execute('''CREATE TABLE CONNECTIONS_NEW (
+                        source_id INTEGER NOT NULL,
+                        target_id INTEGER NOT NULL,
+                        PRIMARY KEY (source_id, target_id),
+                        FOREIGN KEY (source_id) REFERENCES URLs(id),
+                        FOREIGN KEY (target_id) REFERENCES URLs(id)
+                    ) WITHOUT ROWID''')
+    cursor.execute("INSERT OR IGNORE INTO CONNECTIONS_NEW SELECT source_id, target_id FROM CONNECTIONS")
+    cursor.execute("DROP TABLE CONNECTIONS")
+    cursor.execute("ALTER TABLE CONNECTIONS_NEW RENAME TO CONNECTIONS")
+    cursor.execute("CREATE INDEX CONNECTIONS_TARGET ON CONNECTIONS (target_id)")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS URLS_CRAWLED ON URLs (crawled, word_count)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS IMAGES_SOURCE_URL ON IMAGES (source_url)")
+    cursor.execute("ANALYZE")
+
+# Word positions of each posting as varint gaps (indexing.encoding.encode_positions), NULL when not recorded
+def add_positions(cursor):
+    cursor.execute("ALTER TABLE INVERTED_INDEX ADD COLUMN positions BLOB DEFAULT NULL")
+
+MIGRATIONS = [
+    create_tables,
+    add_indexes,
+    add_positions
+]
@@ -0,0 +1,47 @@
+from collections import Counter
+from functools import lru_cache
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+import nltk
+import re
+
+# Text analysis shared by the indexer and the search server
+# Both sides go through analyze(), so a query word always stems to the same term as the page word
+
+# Runs of letters, the same words str.isalpha() kept after NLTK tokenizing
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+")
+
+def load_stop_words():
+    try:
+        return frozenset(stopwords.words('english'))
+    except LookupError:
+        nltk.download('stopwords')
+        return frozenset(stopwords.words('english'))
+
+STOP_WORDS = load_stop_words()
+
+ps = PorterStemmer()
+
+# Most pages reuse the same few thousand words, so stems are memoized
+@lru_cache(maxsize=100000)
+def stem(word):
+    return ps.stem(word)
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+# Stemmed words of a text without stopwords, in order
+def analyze(text):
+    return [stem(word) for word in tokenize(text) if word not in STOP_WORDS]
+
+# How many times each stemmed word appears in a text
+def term_counts(text):
+    return dict(Counter(analyze(text)))
+
+# Positions of each stemmed word in the stopword-free word stream of a text
+# Counted after stopwords are dropped, so "bank of america" and the query "bank america" line up
+def term_positions(text):
+    positions = {}
+    for position, term in enumerate(analyze(text)):
+        positions.setdefault(term, []).append(position)
+    return positions
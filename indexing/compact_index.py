@@ -0,0 +1,186 @@
+from array import array
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+import argparse
+import json
+import mmap
+import os
+import shutil
+import time
+
+from database.schema import connect
+from indexing.encoding import decode_varints, delta_decode, delta_encode, encode_varints
+
+# Read-only inverted index built from search.db and memory-mapped by the search server
+#
+# terms.bin           sorted terms, utf-8, back to back
+# term_offsets.bin    start of each term in terms.bin (uint64, one extra at the end)
+# postings.bin        per term: varint count, varint doc gaps, varint frequencies
+# postings_offsets.bin start of each term's postings (uint64, one extra at the end)
+# doc_ids.bin, doc_lengths.bin, doc_ranks.bin
+#                     url id, word count and pagerank of every document, postings point into these
+# meta.json           document count, average length and build information
+
+def build_index(db_path="search.db", out_dir="index"):
+    connection, cursor = connect(db_path, migrate=False)
+    start = time.time()
+
+    cursor.execute('''SELECT u.id, u.word_count, COALESCE(r.rank, 0) FROM URLs u
+                      LEFT JOIN RANKS r ON r.url_id = u.id
+                      WHERE u.crawled = 1 AND u.word_count > 0 ORDER BY u.id''')
+    doc_ids = array("q")
+    doc_lengths = array("I")
+    doc_ranks = array("d")
+    for page_id, word_count, rank in cursor:
+        doc_ids.append(page_id)
+        doc_lengths.append(word_count)
+        doc_ranks.append(rank)
+    positions = {page_id: doc for doc, page_id in enumerate(doc_ids)}
+
+    cursor.execute("SELECT value FROM SCORE_STATE WHERE name = 'generation'")
+    row = cursor.fetchone()
+    generation = int(row[0]) if row else 0
+
+    # Write next to the old index and swap at the end so a running server never sees half a build
+    build_dir = out_dir.rstrip("/") + ".building"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    term_offsets = array("Q", [0])
+    postings_offsets = array("Q", [0])
+    num_postings = 0
+    with open(os.path.join(build_dir, "terms.bin"), "wb") as terms_file, \
+         open(os.path.join(build_dir, "postings.bin"), "wb") as postings_file:
+        cursor.execute('''SELECT w.word, i.page_id, i.frequency FROM INVERTED_INDEX i
+                          JOIN WORDS w ON w.id = i.word_id ORDER BY w.word, i.page_id''')
+        for word, rows in groupby(cursor, key=itemgetter(0)):
+            docs = []
+            frequencies = []
+            for _, page_id, frequency in rows:
+                doc = positions.get(page_id)
+                if doc is not None:
+                    docs.append(doc)
+                    frequencies.append(frequency)
+            if not docs:
+                continue
+
+            block = encode_varints([len(docs)])
+            encode_varints(delta_encode(docs), block)
+            encode_varints(frequencies, block)
+            postings_file.write(block)
+            postings_offsets.append(postings_offsets[-1] + len(block))
+
+            term = word.encode("utf-8")
+            terms_file.write(term)
+            term_offsets.append(term_offsets[-1] + len(term))
+            num_postings += len(docs)
+
+    for name, values in (("term_offsets.bin", term_offsets), ("postings_offsets.bin", postings_offsets),
+                         ("doc_ids.bin", doc_ids), ("doc_lengths.bin", doc_lengths), ("doc_ranks.bin", doc_ranks)):
+        with open(os.path.join(build_dir, name), "wb") as file:
+            values.tofile(file)
+
+    meta = {
+        "num_docs": len(doc_ids),
+        "avg_length": sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+        "num_terms": len(term_offsets) - 1,
+        "num_postings": num_postings,
+        "generation": generation,
+        "built_at": time.time()
+    }
+    with open(os.path.join(build_dir, "meta.json"), "w") as file:
+        json.dump(meta, file)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(build_dir, out_dir)
+    connection.close()
+
+    print(f"Index built in {time.time() - start:.1f}s: {meta['num_terms']} terms, {num_postings} postings, {meta['num_docs']} documents")
+    return meta
+
+class CompactIndex:
+    def __init__(self, directory="index", cache_size=1024):
+        with open(os.path.join(directory, "meta.json")) as file:
+            self.meta = json.load(file)
+        self.generation = self.meta["generation"]
+
+        self.maps = []
+        self.terms = self._map(directory, "terms.bin")
+        self.postings_data = self._map(directory, "postings.bin")
+        self.term_offsets = self._map(directory, "term_offsets.bin", "Q")
+        self.postings_offsets = self._map(directory, "postings_offsets.bin", "Q")
+        self.doc_ids = self._map(directory, "doc_ids.bin", "q")
+        self.doc_lengths = self._map(directory, "doc_lengths.bin", "I")
+        self.doc_ranks = self._map(directory, "doc_ranks.bin", "d")
+        self.num_terms = len(self.term_offsets) - 1
+
+        # Hot terms stay decoded, everything else is read from the mapped file
+        self.decode = lru_cache(maxsize=cache_size)(self._decode)
+
+    def _map(self, directory, name, typecode=None):
+        with open(os.path.join(directory, name), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                view = memoryview(b"")
+            else:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps.append(mapped)
+                view = memoryview(mapped)
+        return view.cast(typecode) if typecode else view
+
+    def stats(self):
+        return self.meta["num_docs"], self.meta["avg_length"]
+
+    # Position of a term in the sorted term list, or None
+    def find(self, term):
+        key = term.encode("utf-8")
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            current = self.terms[self.term_offsets[middle]:self.term_offsets[middle + 1]].tobytes()
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _decode(self, term_number):
+        start = self.postings_offsets[term_number]
+        end = self.postings_offsets[term_number + 1]
+        data = self.postings_data[start:end]
+        (count, ), offset = decode_varints(data, 0, 1)
+        gaps, offset = decode_varints(data, offset, count)
+        frequencies, _ = decode_varints(data, offset, count)
+        return delta_decode(gaps), frequencies
+
+    # Same rows as SqliteIndex.postings: (page id, frequency, word count, pagerank)
+    def postings(self, term):
+        term_number = self.find(term)
+        if term_number is None:
+            return []
+        docs, frequencies = self.decode(term_number)
+        doc_ids = self.doc_ids
+        doc_lengths = self.doc_lengths
+        doc_ranks = self.doc_ranks
+        return [(doc_ids[doc], frequency, doc_lengths[doc], doc_ranks[doc]) for doc, frequency in zip(docs, frequencies)]
+
+    def close(self):
+        self.decode.cache_clear()
+        for name in ("terms", "postings_data", "term_offsets", "postings_offsets", "doc_ids", "doc_lengths", "doc_ranks"):
+            getattr(self, name).release()
+        for mapped in self.maps:
+            mapped.close()
+        self.maps = []
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the compact search index from search.db")
+    parser.add_argument("--db", default="search.db", help="database written by the crawler")
+    parser.add_argument("--out", default="index", help="directory the search server loads")
+    options = parser.parse_args()
+
+    build_index(options.db, options.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Variable-length integers: 7 bits per byte, high bit set while more bytes follow
+def encode_varints(numbers, out=None):
+    if out is None:
+        out = bytearray()
+    for number in numbers:
+        while number >= 0x80:
+            out.append((number & 0x7F) | 0x80)
+            number >>= 7
+        out.append(number)
+    return out
+
+# Decode count varints starting at offset, returns (numbers, next offset)
+def decode_varints(data, offset=0, count=None):
+    numbers = []
+    number = 0
+    shift = 0
+    end = len(data)
+    while offset < end and (count is None or len(numbers) < count):
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(number)
+            number = 0
+            shift = 0
+    return numbers, offset
+
+# Sorted numbers are stored as gaps so most of them fit in one byte
+def delta_encode(numbers):
+    previous = 0
+    gaps = []
+    for number in numbers:
+        gaps.append(number - previous)
+        previous = number
+    return gaps
+
+def delta_decode(gaps):
+    total = 0
+    numbers = []
+    for gap in gaps:
+        total += gap
+        numbers.append(total)
+    return numbers
+
+# Word positions of one posting as a blob: varint gaps between the sorted positions
+def encode_positions(positions):
+    return bytes(encode_varints(delta_encode(positions)))
+
+def decode_positions(blob):
+    return delta_decode(decode_varints(blob)[0])
@@ -0,0 +1,112 @@
+from html.parser import HTMLParser
+import codecs
+import re
+
+# Single pass extraction of links, images, title, description and text
+# Uses the event based parser from the standard library, so no tree is built for a page
+
+# Text inside these tags is never shown, BeautifulSoup's get_text skips it too
+SKIPPED_TAGS = {"script", "style", "template"}
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+HEADER_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+class PageExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.meta_description = None
+        self.hrefs = []
+        self.images = []
+        self.texts = []
+        self.paragraphs = []
+        self.open_paragraph = None
+        self.in_title = False
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+            return
+        attrs = dict(attrs)
+
+        if tag == "a":
+            if attrs.get("href") is not None:
+                self.hrefs.append(attrs["href"])
+        elif tag == "img":
+            # The context is the text of the last paragraph opened before the image,
+            # it is filled in once the paragraph has been read to its end
+            src = attrs.get("src") or attrs.get("data-src") or attrs.get("data-lazy-src")
+            paragraph = len(self.paragraphs) - 1 if self.paragraphs else None
+            self.images.append((src, attrs.get("title") or "", attrs.get("alt") or "", paragraph))
+        elif tag == "p":
+            self.paragraphs.append([])
+            self.open_paragraph = self.paragraphs[-1]
+        elif tag == "title":
+            if self.title is None:
+                self.title = ""
+                self.in_title = True
+        elif tag == "meta":
+            if self.meta_description is None and (attrs.get("name") or "").lower() == "description" \
+                    and attrs.get("content") is not None:
+                self.meta_description = attrs["content"]
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(self.skipping - 1, 0)
+        elif tag == "p":
+            self.open_paragraph = None
+        elif tag == "title":
+            self.in_title = False
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        if self.in_title:
+            self.title += data
+        if self.open_paragraph is not None:
+            self.open_paragraph.append(data)
+        data = data.strip()
+        if data:
+            self.texts.append(data)
+
+    def text(self):
+        return " ".join(self.texts)
+
+    # (src, title, alt, context) for every image on the page
+    def image_tags(self):
+        paragraphs = ["".join(parts)[:200] for parts in self.paragraphs]
+        return [(src, title, alt, paragraphs[paragraph] if paragraph is not None else None)
+                for src, title, alt, paragraph in self.images]
+
+# Charset from the Content-Type header, then from a meta tag near the top of the page
+def find_charset(content, content_type=None):
+    for charset in (header_charset(content_type), meta_charset(content)):
+        if charset is None:
+            continue
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            continue
+    return None
+
+def header_charset(content_type):
+    if not content_type:
+        return None
+    match = HEADER_CHARSET.search(content_type)
+    return match.group(1) if match else None
+
+def meta_charset(content):
+    match = META_CHARSET.search(content[:4096])
+    return match.group(1).decode("ascii", "ignore") if match else None
+
+def decode_page(content, content_type=None):
+    if content.startswith(codecs.BOM_UTF8):
+        return content[len(codecs.BOM_UTF8):].decode("utf-8", errors="replace")
+    return content.decode(find_charset(content, content_type) or "utf-8", errors="replace")
+
+def extract(content, content_type=None):
+    extractor = PageExtractor()
+    extractor.feed(decode_page(content, content_type))
+    extractor.close()
+    return extractor
@@ -0,0 +1,52 @@
+from bs4 import BeautifulSoup
+
+from crawling.urls import canonicalize
+from indexing.extractor import extract, find_charset
+from indexing.indexer import image_url, index, index_images, index_text
+
+# Turn a href into a canonical absolute http(s) url, None for anchors and other schemes
+def resolve_link(current_url, url):
+    if url.startswith("#"):
+        return None
+    return canonicalize(url, current_url)
+
+# Parse and index a downloaded page
+# Runs in a worker process, so it takes raw bytes and only returns small picklable results
+# extractor is "stream" for the single pass parser or "soup" for a full BeautifulSoup tree
+# positions also keeps where every word is on the page, for phrase queries
+def parse_page(url, content, content_type=None, extractor="stream", positions=False):
+    if extractor == "soup":
+        return parse_soup(url, content, content_type, positions)
+
+    page = extract(content, content_type)
+
+    links = []
+    for href in page.hrefs:
+        link = resolve_link(url, href)
+        if link is not None:
+            links.append(link)
+
+    images = []
+    for src, title, alt, context in page.image_tags():
+        img_url = image_url(url, src)
+        if img_url is not None:
+            images.append((img_url, title, alt, url, context))
+
+    indexed_page = index_text(url, page.title, page.meta_description, page.text(), positions)
+    indexed_page["links"] = list(dict.fromkeys(links))
+    indexed_page["images"] = images
+    return indexed_page
+
+def parse_soup(url, content, content_type=None, positions=False):
+    page = BeautifulSoup(content, "html.parser", from_encoding=find_charset(content, content_type))
+
+    links = []
+    for hyperlink in page.select("a[href]"):
+        link = resolve_link(url, hyperlink["href"])
+        if link is not None:
+            links.append(link)
+
+    indexed_page = index(page, url, positions)
+    indexed_page["links"] = list(dict.fromkeys(links))
+    indexed_page["images"] = index_images(url, page.find_all("img"))
+    return indexed_page
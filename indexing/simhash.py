@@ -0,0 +1,41 @@
+import hashlib
+import numpy as np
+
+# 64 bit SimHash of a page's terms
+# Pages with nearly the same words get fingerprints a few bits apart, so near-duplicates are found
+# by splitting fingerprints into 4 bands of 16 bits: two fingerprints at most 3 bits apart share a band
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Pages with fewer distinct terms than this give fingerprints too coarse to compare
+MIN_TERMS = 10
+
+def term_hash(term):
+    return hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+
+# Fingerprint of {term: count}, None when there are too few terms
+def simhash(term_counts):
+    if len(term_counts) < MIN_TERMS:
+        return None
+    hashes = np.frombuffer(b"".join(term_hash(term) for term in term_counts), dtype=np.uint8).reshape(-1, 8)
+    bits = np.unpackbits(hashes, axis=1, bitorder="little").astype(np.int64)
+    weights = np.fromiter(term_counts.values(), dtype=np.int64, count=len(term_counts))
+    # Every term votes +count for its set bits and -count for the others
+    votes = weights @ (2 * bits - 1)
+    return int(np.packbits(votes > 0, bitorder="little").view("<u8")[0])
+
+def bands(fingerprint):
+    return [(fingerprint >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
+
+def distance(first, second):
+    return bin(first ^ second).count("1")
+
+# sqlite integers are signed 64 bit
+def to_signed(fingerprint):
+    return fingerprint - (1 << BITS) if fingerprint >= 1 << (BITS - 1) else fingerprint
+
+def to_unsigned(fingerprint):
+    return fingerprint + (1 << BITS) if fingerprint < 0 else fingerprint
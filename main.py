@@ -1,15 +1,25 @@
-from bs4 import BeautifulSoup
 from concurrent.futures import ThreadPoolExecutor
-from urllib.parse import urlparse
-from queue import Queue
+import argparse
+import os
 import random
 import requests
-import sqlite3
 import time
 import threading
 
-from indexing.indexer import index, index_images
-from ranking.pagerank import ranking, tf_idf, combine_scores
+from crawling.async_crawler import async_crawl
+from crawling.frontier import Frontier
+from crawling.parsing import ParsePool
+from crawling.pipeline import TOO_LARGE, fetch_failed, handle_page, handle_response, robots_allowed, valid_url
+from crawling.revisit import conditional_headers
+from crawling.robots import RobotsCache
+from crawling.urls import SeenSet
+from crawling.writer import IndexWriter
+from database.schema import connect
+from indexing.parser import parse_page
+from monitoring.crawl import (ERRORS, FETCH_SECONDS, LOCK_WAIT_SECONDS, PARSE_SECONDS, RANK_SECONDS, ROBOTS_SECONDS,
+                              ProgressReport, watch)
+from monitoring.metrics import serve, timed_lock
+from ranking.pagerank import ranking, tf_idf, tf_idf_incremental, combine_scores
 
 HEADERS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -18,349 +28,188 @@ HEADERS = [
     'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36'
 ]
 
-# Connect to db and create tables if they do not exist yet
-def db_connect():
-    connection = sqlite3.connect("search.db", check_same_thread=False)
-    cursor = connection.cursor()
-
-    # Create SQL tables if they do not exist yet
-    cursor.execute('''CREATE TABLE IF NOT EXISTS URLs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        url TEXT UNIQUE NOT NULL,
-                        title TEXT,
-                        description TEXT,
-                        word_count INTEGER,
-                        final_rank REAL DEFAULT NULL,
-                        crawled BOOLEAN DEFAULT 0
-                    )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS WORDS (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        word TEXT UNIQUE NOT NULL
-                    )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS IMAGES (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        title TEXT,
-                        alt TEXT,
-                        context TEXT,
-                        source_url INTEGER NOT NULL,
-                        image TEXT UNIQUE NOT NULL,
-                        FOREIGN KEY (source_url) REFERENCES URLs(id)
-                    )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS INVERTED_INDEX (
-                        word_id INTEGER NOT NULL,
-                        page_id INTEGER NOT NULL,
-                        frequency INTEGER DEFAULT 1,
-                        score DEFAULT NULL,
-                        UNIQUE (word_id, page_id),
-                        FOREIGN KEY (word_id) REFERENCES WORDS(id),
-                        FOREIGN KEY (page_id) REFERENCES URLs(id)
-                    )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS BLOCKED_URLs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        url TEXT UNIQUE NOT NULL
-                    )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS CONNECTIONS (
-                        source_id INTEGER NOT NULL,
-                        target_id INTEGER NOT NULL,
-                        FOREIGN KEY (source_id) REFERENCES URLs(id),
-                        FOREIGN KEY (target_id) REFERENCES URLs(id)
-                    )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS RANKS (
-                        url_id INTEGER UNIQUE NOT NULL,
-                        rank REAL NOT NULL,
-                        FOREIGN KEY (url_id) REFERENCES URLs(id)
-                   )''')
-
-    return connection, cursor
+# Connect to db and bring its schema up to date
+def db_connect(path="search.db"):
+    return connect(path)
 
-# Check robots.txt on each site to prevent going to unauthorized site and getting blocked
-def can_parse(args, url):
-    lock = args["lock"]
-    parsed_url = urlparse(url)
-
-    if not parsed_url.scheme or not parsed_url.netloc:
-        print(f"Invalid URL format: {url}")
-        return False
-
-    # Only process HTTP/HTTPS URLs
-    if parsed_url.scheme not in ('http', 'https'):
-        print(f"Skipping non-HTTP URL: {url}")
-        return False
-
-    robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
+# Download robots.txt for the robots cache
+def fetch_robots(robots_url):
     try:
         response = requests.get(robots_url, timeout=10)
-        disallowed = []
-
-        for line in response.text.splitlines():
-            if line.lower().startswith("user-agent:"):
-                parts = line.split()
-                current_agent = parts[1]
-            if line.startswith("disallow"):
-                parts = line.split()
-                if current_agent == "*" and len(parts) > 1:
-                    disallowed.append(parts[1])
-        
-        for path in disallowed:
-            if urlparse(url).path.startswith(path):
-                print(f"DISALLOWED: {robots_url}")
-                return False
-        return True
+        return response.status_code, response.text
     except requests.RequestException as e:
         print(f"Failed to access robots.txt: {robots_url}")
         print(f"Error: {e}")
-        return False
-    except Exception as e:
-        print(f"Error with Robots.txt: {e}")
-        return False
+        return None, None
 
-def parse_links(args, current_url, hyperlinks):
-    queue = args["queue"]
-    lock = args["lock"]
-    connection = args["connection"]
-    cursor = args["cursor"]
-    connections = set()
-
-    # Buffer to prevent too many sql injections
-    BATCH_SIZE = 500
-    buffer = []
-
-    with lock:
-        cursor.execute("SELECT id FROM URLs WHERE url = ?", (current_url, ))
-        row = cursor.fetchone()
-        if row:
-            current_id = row[0]
-        else:
-            return
-
-    for hyperlink in hyperlinks:
-        try:
-            url = hyperlink["href"]
-            if url.startswith("#"):
-                continue
-            elif url.startswith("//"):
-                url = "https:" + url
-            elif url.startswith("/"):
-                base = "{0.scheme}://{0.netloc}".format(requests.utils.urlparse(current_url))
-                url = base + url
-            elif not url.startswith("http"):
-                continue
+# Check robots.txt on each site to prevent going to unauthorized site and getting blocked
+def can_parse(args, url):
+    rules = None
+    if valid_url(url):
+        # robots.txt is downloaded once per host and shared by every worker
+        rules = args["robots"].get(url)
+    return robots_allowed(args, url, rules)
+
+# Parse and index a page in the process pool, or in this thread without one
+def parse_content(args, url, content, content_type):
+    pool = args["parser"]
+    if pool is None:
+        return parse_page(url, content, content_type, args["extractor"], args["positions"])
+    return pool.parse(url, content, content_type, args["extractor"], args["positions"])
+
+# Download a page in chunks and stop as soon as it is larger than max_bytes
+# previous makes the request conditional, see crawling.pipeline for what is returned
+def fetch_page(url, max_bytes, previous=None):
+    headers = {'User-Agent': random.choice(HEADERS)}
+    headers.update(conditional_headers(previous))
+    with requests.get(url, headers=headers, timeout=20, stream=True) as response:
+        response.raise_for_status()
+        validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        content_type = response.headers.get('Content-Type', '').lower()
+        if response.status_code == 304 or not content_type.startswith('text/html'):
+            return response.status_code, content_type, None, validators
+
+        length = response.headers.get('Content-Length', '')
+        if length.isdigit() and int(length) > max_bytes:
+            return response.status_code, content_type + TOO_LARGE, None, validators
+
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size=65536):
+            content.extend(chunk)
+            if len(content) > max_bytes:
+                return response.status_code, content_type + TOO_LARGE, None, validators
+        return response.status_code, content_type, bytes(content), validators
 
-            with lock:
-                # Check if the url is blocked
-                cursor.execute("SELECT * FROM BLOCKED_URLs WHERE url = ?", (url, ))
-                if not cursor.fetchone():
-                    buffer.append((url,))
-            if len(buffer) > BATCH_SIZE:
-                with lock:
-                    cursor.executemany("INSERT OR IGNORE INTO URLs (url) VALUES (?)", buffer)
-                    connection.commit()
-
-                    urls = tuple(url for (url,) in buffer)
-                    bindings = ", ".join(["?"] * len(urls))
-                    cursor.execute(f"SELECT id FROM URLs WHERE url IN ({bindings})", urls)
-                    target_ids = cursor.fetchall()
-
-                    connection_data = []
-                    for target_id in target_ids:
-                        connection_data.append((current_id, target_id[0]))
-
-                    cursor.executemany("INSERT INTO CONNECTIONS (source_id, target_id) VALUES (?, ?)", connection_data)
-                    connection.commit()
-
-                    for url in buffer:
-                        queue.put(url[0])
-                    buffer = []
-            connections.add(url)
-            
-        except Exception as e:
-            print(f"Error processing hyperlink: {e}")
-            continue
-    if buffer:
-        with lock:
-            cursor.executemany("INSERT OR IGNORE INTO URLs (url) VALUES (?)", buffer)
-            connection.commit()
-            urls = tuple(url for (url,) in buffer)
-            bindings = ", ".join(["?"] * len(urls))
-            cursor.execute(f"SELECT id FROM URLs WHERE url IN ({bindings})", urls)
-            target_ids = cursor.fetchall()
-
-            connection_data = []
-            for target_id in target_ids:
-                connection_data.append((current_id, target_id[0]))
-                
-            cursor.executemany("INSERT OR IGNORE INTO CONNECTIONS (source_id, target_id) VALUES (?, ?)", connection_data)
-            connection.commit()
-
-            for url in buffer:
-                queue.put(url[0])
-    return connections
-    
 def crawl(args):
-    queue = args["queue"]
+    frontier = args["frontier"]
     lock = args["lock"]
-    count = args["count"]
     stop_crawl = args["stop_crawl"]
-    connection = args["connection"]
-    cursor = args["cursor"]
     errors = args["errors"]
-    domain_delay = 2.0
-    domain_last_request = {}
     
     while not stop_crawl.is_set():
-        try:
-            url = queue.get(timeout=1.0)
-        except queue.Empty:
-            # Make sure that there are urls that need to be crawled
-            cursor.execute("SELECT COUNT(*) FROM URLs WHERE crawled = 0")
-            remaining = cursor.fetchone()[0]
-            if remaining == 0:
+        with LOCK_WAIT_SECONDS.time(lock="frontier"):
+            item = frontier.get()
+        if item is None:
+            # Nothing queued and no other worker can add more links
+            if frontier.finished():
                 stop_crawl.set()
                 break
-            else:
-                continue
+            # Wait outside of any lock until a host is eligible again
+            wait = frontier.wait_time()
+            time.sleep(min(wait if wait is not None else 0.5, 0.5))
+            continue
+        current_url, depth = item
 
         try:
-            with lock:
-                # Get the first url that has not been crawled
-                cursor.execute("SELECT id, url, crawled FROM URLs WHERE url = ? AND crawled = 0 LIMIT 1", (url, ))
-                row = cursor.fetchone()
-                if row is None:
-                    continue        
-                url_id = row[0]
-                current_url = row[1]
-                crawled = row[2]
-
-                # Check robots.txt
-                if not can_parse(args, current_url):
-                    cursor.execute("INSERT OR IGNORE INTO BLOCKED_URLs (url) VALUES (?)", (url, ))
-                    cursor.execute("DELETE FROM URLs WHERE url = ?", (url, ))
-                    connection.commit()
-                    continue
-
-            parsed = urlparse(current_url)
-            domain = parsed.netloc
-
-            # Delay to prevent issues in browser
-            with lock:
-                last_time = domain_last_request.get(domain, 0)
-                current_time = time.time()
-                elapsed = current_time - last_time
-                
-                # Sleep only if needed for this domain
-                if elapsed < domain_delay:
-                    sleep_time = domain_delay - elapsed
-                    time.sleep(sleep_time)
-                
-                # Update last request time for this domain
-                domain_last_request[domain] = time.time()
+            # Check robots.txt outside of the lock, it may need a download
+            with ROBOTS_SECONDS.time():
+                allowed = can_parse(args, current_url)
+            if not allowed:
+                continue
 
+            previous = args["fetch_state"].get(current_url)
             try:
-                response = requests.get(current_url, headers={'User-Agent': random.choice(HEADERS)}, timeout=20)
-                response.raise_for_status() 
+                with FETCH_SECONDS.time():
+                    status, content_type, content, validators = fetch_page(current_url, args["max_bytes"], previous)
             except requests.RequestException as e:
-                print(f"Failed to retrieve {current_url}: {e}")
-                with lock:
-                    cursor.execute("INSERT OR IGNORE INTO BLOCKED_URLs (url) VALUES (?)", (current_url, ))
-                    cursor.execute("DELETE FROM URLs WHERE id = ?", (url_id, ))
-                    connection.commit()
+                fetch_failed(args, current_url, e)
+                continue
+
+            state = handle_response(args, current_url, status, content_type, content, validators, previous)
+            if state is None:
                 continue
-            
-            # Make sure that the content of url is in HTML
-            content_type = response.headers.get('Content-Type', '').lower()
-            # Else insert into urls as Non-HTML and continue
-            if not content_type.startswith('text/html'):
-                with lock:
-                    cursor.execute("SELECT id, crawled FROM URLs WHERE url = ?", (current_url, ))
-                    row = cursor.fetchone()
-                    url_id = row[0]
-                    # If non-HTML url is not already in URLs, insert it
-                    if crawled == 0:
-                        cursor.execute("UPDATE URLs SET title = ?, description = ?, crawled = 1 WHERE id = ?", ("Non-HTML", content_type, url_id, ))
-                        connection.commit()
-                    continue
-
-            page = BeautifulSoup(response.content, "html.parser", from_encoding="iso-8859-1")
-            hyperlinks = page.select("a[href]")
-            images = page.find_all("img")
-            parse_links(args, current_url, hyperlinks)
-            
-            # Create graph for urls that current url connects to
-            with lock:
-                cursor.execute("SELECT id FROM URLs WHERE url = ? and crawled = 1", (current_url, ))
-                # Check if url has already been crawled
-                if cursor.fetchone() is not None:
-                    # Skip url if already crawled
-                    continue
-                count[0] += 1
-                if count[0] > args["max_urls"]:
-                    # Clear remaining urls to stop processing them
-                    queue.queue.clear()
-                    print(f"Errors: {errors[0]}")
-                    print("Crawl limit reached. Exiting...")
-                    stop_crawl.set()
-                    break
-                
+
             # Get information on each page
-            # Title, description, and word count
-            indexed_page = index(args, page, current_url)
-            valid_images = index_images(args, current_url, images)
-            with lock:
-                # Save images to db
-                cursor.executemany("INSERT OR IGNORE INTO IMAGES (image, title, alt, source_url, context) VALUES (?, ?, ?, ?, ?)", valid_images)
-
-                # Set url to have been crawled
-                cursor.execute("SELECT id FROM URLs WHERE url = ?", (current_url, ))
-                row = cursor.fetchone()
-                if row:
-                    url_id = row[0]
-                
-                # Store url information into db
-                cursor.execute("UPDATE URLs SET title = ?, description = ?, word_count = ?, crawled = 1 WHERE id = ?", (indexed_page["title"], indexed_page["description"], len(indexed_page["filtered_words"]), url_id))
-
-                # Store word in inverted index
-                for word in indexed_page["filtered_words"]:
-                    cursor.execute("INSERT OR IGNORE INTO WORDS (word) VALUES (?)", (word, ))
-
-                    cursor.execute("SELECT id FROM WORDS WHERE word = ?", (word, ))
-                    word_id = cursor.fetchone()[0]
-                    
-                    cursor.execute("INSERT INTO INVERTED_INDEX (word_id, page_id, frequency) VALUES (?, ?, ?) ON CONFLICT DO UPDATE SET frequency = excluded.frequency", (word_id, url_id, indexed_page["filtered_words"][word]))
-
-                connection.commit()
+            # Title, description, word count, links and images
+            with PARSE_SECONDS.time():
+                indexed_page = parse_content(args, current_url, content, content_type)
+            handle_page(args, current_url, depth, indexed_page, previous, state)
         except Exception as e:
+            with timed_lock(lock, LOCK_WAIT_SECONDS, lock="count"):
+                errors[0] += 1
+            ERRORS.inc()
             print(f"Error: {e}")
         finally:
-            queue.task_done()
-
-def spider_bot(connection, cursor):
-    cursor.execute("SELECT url FROM URLs WHERE crawled = 0 LIMIT 3")
-    starting_urls = [url[0] for url in cursor.fetchall()]
-    if not starting_urls:
-        starting_urls = [
-            "https://en.wikipedia.org/wiki/Google",
-            "https://www.bbc.com/news/world",
-            "https://news.ycombinator.com/",
-        ]
-    for url in starting_urls:
-        cursor.execute("INSERT OR IGNORE INTO URLs (url) VALUES (?)", (url, ))
-        connection.commit()
-
-    cursor.execute("SELECT url FROM URLs WHERE crawled = 0 LIMIT 3")
-    urls_to_crawl = Queue()
-    for url in cursor.fetchall():
-        urls_to_crawl.put(url[0])
+            frontier.done(current_url)
+
+# Pagerank from the last session, used to estimate the rank of newly found links
+def load_ranks(cursor):
+    cursor.execute("SELECT u.url, r.rank FROM RANKS r JOIN URLs u ON u.id = r.url_id")
+    return {url: rank for url, rank in cursor.fetchall()}
+
+# Crawled and blocked urls are kept in memory so the workers never query the db
+# Returns (seen, blocked), urls are added to seen as they are queued
+def load_seen(cursor, mode="exact", capacity=10000000):
+    seen = SeenSet(mode, capacity)
+    blocked = SeenSet(mode, capacity)
+    cursor.execute("SELECT url FROM URLs WHERE crawled = 1")
+    seen.update(row[0] for row in cursor)
+    cursor.execute("SELECT url FROM BLOCKED_URLs")
+    for (url, ) in cursor:
+        seen.add(url)
+        blocked.add(url)
+    return seen, blocked
+
+# Urls saved by the last crawl's checkpoints as (url, depth, priority, next eligible time)
+# Urls that were being fetched when the crawl stopped are retried, up to max_retries times
+def load_frontier(connection, cursor, max_retries=3):
+    cursor.execute("UPDATE FRONTIER SET state = 'queued', retries = retries + 1 WHERE state = 'in_progress'")
+    cursor.execute("UPDATE FRONTIER SET state = 'failed' WHERE state = 'queued' AND retries > ?", (max_retries, ))
+    connection.commit()
+
+    cursor.execute('''SELECT u.url, f.depth, f.priority, f.next_eligible FROM FRONTIER f
+                      JOIN URLs u ON u.id = f.url_id
+                      WHERE f.state = 'queued' AND u.crawled = 0''')
+    return cursor.fetchall()
+
+# Crawled pages whose next visit is due, with the fetch state of their last visit
+# Pages crawled before fetch states were kept are due right away
+# Non-HTML pages are never revisited, oversized ones are (their description is the content type)
+def load_due(cursor, limit):
+    cursor.execute('''SELECT u.url, f.etag, f.last_modified, f.content_hash, f.interval FROM URLs u
+                      LEFT JOIN FETCH_STATE f ON f.url_id = u.id
+                      WHERE u.crawled = 1 AND (u.title != 'Non-HTML' OR u.description LIKE ?) AND (f.next_visit IS NULL OR f.next_visit <= ?)
+                      ORDER BY f.next_visit LIMIT ?''', (f"%{TOO_LARGE}", time.time(), limit))
+    return {url: (etag, last_modified, content_hash, interval) for url, etag, last_modified, content_hash, interval in cursor.fetchall()}
+
+# seeds, max_urls, domain_delay and per_host override the defaults below, the benchmarks crawl a local web with them
+def spider_bot(connection, cursor, mode="threads", incremental=False, recrawl=False, seeds=None, max_urls=10000, domain_delay=2.0, per_host=2):
     crawl_count = [0]
-    page_id = [0]
     errors = [0]
-    word_index = {}
-    page_index = {}
 
     # Number of URLs to crawl
     # Feel free to change for your preference
     # Change number of crawlers to help crawl faster
-    MAX_URLS = 10000
+    MAX_URLS = max_urls
     NUM_WORKERS = 20
+    # Processes that parse and index pages, 0 parses in the crawl workers
+    PARSE_WORKERS = os.cpu_count() or 1
+    # Async mode only: open requests in total
+    CONCURRENCY = 100
+    # Politeness for each host: seconds between requests and requests at once
+    # "depth" crawls shallow pages first, "rank" follows links from high pagerank pages first
+    DOMAIN_DELAY = domain_delay
+    PER_HOST = per_host
+    HOST_DELAYS = {}
+    PRIORITY = "depth"
+    # "exact" remembers every seen url, "bloom" uses a fixed amount of memory for up to SEEN_CAPACITY urls
+    SEEN_MODE = "exact"
+    SEEN_CAPACITY = 10000000
+    # Pages at most this many bits from an indexed page's SimHash are near-duplicates and not indexed, None indexes all
+    DUPLICATE_DISTANCE = 3
+    # Seconds between progress lines, and a port to serve crawl metrics on at /metrics (None for no server)
+    PROGRESS_INTERVAL = 30.0
+    METRICS_PORT = None
+    # Seconds between saves of the frontier, and attempts at a url that keeps stopping the crawl
+    CHECKPOINT_INTERVAL = 10.0
+    MAX_RETRIES = 3
+    # Pages larger than this are not downloaded to the end or indexed
+    MAX_PAGE_BYTES = 5 * 1024 * 1024
+    # "stream" extracts pages in one pass, "soup" builds a BeautifulSoup tree
+    EXTRACTOR = "stream"
+    # Store where every word is on a page, needed for "quoted phrase" queries and the proximity boost
+    # False keeps only word counts and a smaller index
+    POSITIONS = True
     lock = threading.Lock()
     stop_crawl = threading.Event()
 
@@ -368,41 +217,117 @@ def spider_bot(connection, cursor):
         "count": crawl_count,
         "max_urls": MAX_URLS,
         "lock": lock,
-        "queue": urls_to_crawl,
-        "word_index": word_index,
-        "page_index": page_index,
-        "page_id": page_id,
         "stop_crawl": stop_crawl,
-        "connection": connection,
-        "cursor": cursor,
-        "errors": errors
+        "errors": errors,
+        "max_bytes": MAX_PAGE_BYTES,
+        "extractor": EXTRACTOR,
+        "positions": POSITIONS
     }
 
-    with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
-        for _ in range(NUM_WORKERS):
-            executor.submit(crawl, args)
-
-        print("All URLs have been crawled")
+    frontier = Frontier(delay=DOMAIN_DELAY, concurrency=PER_HOST, priority=PRIORITY)
+    for host, delay in HOST_DELAYS.items():
+        frontier.set_delay(host, delay)
+    args["seen"], args["blocked"] = load_seen(cursor, SEEN_MODE, SEEN_CAPACITY)
+
+    # Resume from the saved frontier, a database from before checkpoints starts from its uncrawled urls
+    saved = load_frontier(connection, cursor, MAX_RETRIES)
+    if saved:
+        for url, depth, priority, next_eligible in saved:
+            args["seen"].add(url)
+            frontier.put(url, depth, priority, next_eligible)
+        # Already saved, the next checkpoint only needs what changes from here
+        frontier.checkpoint()
+        print(f"Resuming crawl with {len(saved)} queued urls")
+    else:
+        cursor.execute("SELECT url FROM URLs WHERE crawled = 0")
+        starting_urls = [url[0] for url in cursor.fetchall()]
+        if not starting_urls and not recrawl:
+            starting_urls = list(seeds or [
+                "https://en.wikipedia.org/wiki/Google",
+                "https://www.bbc.com/news/world",
+                "https://news.ycombinator.com/",
+            ])
+        cursor.executemany("INSERT OR IGNORE INTO URLs (url) VALUES (?)", [(url, ) for url in starting_urls])
+        connection.commit()
+        for url in starting_urls:
+            if args["seen"].add(url):
+                frontier.put(url)
+    args["frontier"] = frontier
+    args["robots"] = RobotsCache(fetch_robots)
+    args["robots_waits"] = {}
+    args["ranks"] = load_ranks(cursor)
+
+    # Revisit pages that are due, with conditional requests so unchanged pages cost next to nothing
+    args["fetch_state"] = {}
+    if recrawl:
+        args["fetch_state"] = load_due(cursor, MAX_URLS)
+        for url in args["fetch_state"]:
+            frontier.put(url)
+        print(f"Recrawling {len(args['fetch_state'])} pages")
+
+    # Only the writer thread uses the connection until the crawl is over
+    writer = IndexWriter(connection, frontier=frontier, checkpoint_interval=CHECKPOINT_INTERVAL, duplicate_distance=DUPLICATE_DISTANCE)
+    args["writer"] = writer
+    writer.start()
+
+    # Parsing is CPU bound, so it runs in other processes to use every core
+    parser = None
+    if PARSE_WORKERS > 0:
+        parser = ParsePool(PARSE_WORKERS)
+    args["parser"] = parser
+
+    # Where the time goes, printed every PROGRESS_INTERVAL seconds and optionally served
+    watch(frontier, writer)
+    crawl_done = threading.Event()
+    ProgressReport(crawl_done, PROGRESS_INTERVAL).start()
+    if METRICS_PORT is not None:
+        serve(METRICS_PORT)
+
+    if mode == "async":
+        args["headers"] = HEADERS
+        args["concurrency"] = CONCURRENCY
+        async_crawl(args)
+    else:
+        with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
+            for _ in range(NUM_WORKERS):
+                executor.submit(crawl, args)
+        print(f"Errors: {errors[0]}")
+    crawl_done.set()
+    # Saves the last checkpoint, urls left in the frontier are resumed by the next crawl
+    writer.close()
+    if parser is not None:
+        parser.shutdown()
+
+    print("All URLs have been crawled")
+    if writer.duplicates:
+        print(f"{writer.duplicates} near-duplicate pages were not indexed")
 
     # Rank pages and words
-    ranking(connection, cursor)
-    tf_idf(connection, cursor)
-    combine_scores(connection, cursor)
-
-    # Store urls that did not get crawled in the session into batch
-    batch = []
-    while not urls_to_crawl.empty():
-        url = urls_to_crawl.get()
-        batch.append((url, ))
-
-    # Store urls that were not yet added to db into the db
-    if batch:
-        cursor.executemany("INSERT OR IGNORE INTO URLs (url) VALUES (?)", batch)
-        connection.commit()
+    if incremental:
+        # Only rescore what this session changed
+        with RANK_SECONDS.time(phase="pagerank"):
+            ranking(connection, cursor, warm_start=True)
+        with RANK_SECONDS.time(phase="tf_idf"):
+            tf_idf_incremental(connection, cursor)
+        with RANK_SECONDS.time(phase="combine_scores"):
+            combine_scores(connection, cursor, changed_only=True)
+    else:
+        with RANK_SECONDS.time(phase="pagerank"):
+            ranking(connection, cursor)
+        with RANK_SECONDS.time(phase="tf_idf"):
+            tf_idf(connection, cursor)
+        with RANK_SECONDS.time(phase="combine_scores"):
+            combine_scores(connection, cursor)
 
 def main():
+    parser = argparse.ArgumentParser(description="Crawl the web and rank the pages in search.db")
+    parser.add_argument("--mode", choices=["threads", "async"], default="threads", help="crawl with a thread pool or with one asyncio event loop")
+    parser.add_argument("--incremental", action="store_true", help="rescore only the pages and words changed by this crawl")
+    parser.add_argument("--recrawl", action="store_true", help="revisit crawled pages that are due and index the ones that changed")
+    options = parser.parse_args()
+
     connection, cursor = db_connect()
-    spider_bot(connection, cursor)
+    spider_bot(connection, cursor, options.mode, options.incremental, options.recrawl)
     connection.close()
 
 if __name__ == "__main__":
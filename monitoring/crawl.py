@@ -0,0 +1,55 @@
+import threading
+import time
+
+from monitoring.metrics import Counter, Gauge, Histogram
+
+# Metrics of the crawler, shared by the thread and the asyncio crawl modes
+
+FETCH_SECONDS = Histogram("crawl_fetch_seconds", "Time to download a page")
+ROBOTS_SECONDS = Histogram("crawl_robots_seconds", "Time to check robots.txt for a url, including downloads")
+PARSE_SECONDS = Histogram("crawl_parse_seconds", "Time to parse and index a page, including the wait for a parse worker")
+WRITE_SECONDS = Histogram("crawl_write_seconds", "Time the writer takes to store one batch")
+LOCK_WAIT_SECONDS = Histogram("crawl_lock_wait_seconds", "Time spent waiting for a shared lock")
+RANK_SECONDS = Histogram("crawl_rank_seconds", "Time of each ranking phase after the crawl")
+
+PAGES = Counter("crawl_pages_total", "Urls handled by the crawl workers by result")
+ERRORS = Counter("crawl_errors_total", "Unexpected errors in the crawl workers")
+PAGES_WRITTEN = Counter("crawl_pages_written_total", "Pages stored by the writer")
+FETCHED_BYTES = Counter("crawl_fetched_bytes_total", "Bytes of page content downloaded")
+PARSE_POOL_RESTARTS = Counter("crawl_parse_pool_restarts_total", "Parse pools started again after a parse process died")
+
+FRONTIER_SIZE = Gauge("crawl_frontier_size", "Urls waiting in the frontier")
+IN_FLIGHT = Gauge("crawl_in_flight", "Urls being fetched or parsed")
+WRITER_QUEUE = Gauge("crawl_writer_queue", "Messages waiting for the writer")
+
+# Gauges read the frontier and the writer when the metrics are rendered
+def watch(frontier, writer):
+    FRONTIER_SIZE.function = lambda: len(frontier)
+    IN_FLIGHT.function = lambda: frontier.in_flight
+    WRITER_QUEUE.function = lambda: writer.queue.qsize()
+
+def seconds(value):
+    return "-" if value is None else f"{value:g}s"
+
+# Prints a line of crawl progress every interval seconds until stop is set
+class ProgressReport(threading.Thread):
+    def __init__(self, stop, interval=30.0):
+        super().__init__(daemon=True)
+        self.stop = stop
+        self.interval = interval
+
+    def run(self):
+        start = time.time()
+        last_time = start
+        last_pages = 0
+        while not self.stop.wait(self.interval):
+            now = time.time()
+            pages = PAGES.get(result="indexed")
+            rate = (pages - last_pages) / (now - last_time)
+            last_time, last_pages = now, pages
+            print(f"Progress after {now - start:.0f}s: {pages:.0f} pages indexed ({rate:.1f}/s), "
+                  f"{PAGES.total():.0f} urls handled, {ERRORS.total():.0f} errors, "
+                  f"frontier {FRONTIER_SIZE.get():.0f}, in flight {IN_FLIGHT.get():.0f}, writer queue {WRITER_QUEUE.get():.0f}, "
+                  f"p50/p99 fetch {seconds(FETCH_SECONDS.quantile(0.5))}/{seconds(FETCH_SECONDS.quantile(0.99))}, "
+                  f"parse {seconds(PARSE_SECONDS.quantile(0.5))}/{seconds(PARSE_SECONDS.quantile(0.99))}, "
+                  f"robots {seconds(ROBOTS_SECONDS.quantile(0.5))}, write {seconds(WRITE_SECONDS.quantile(0.5))}")
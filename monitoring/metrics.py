@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import math
+import threading
+import time
+
+# Counters, gauges and histograms in the Prometheus text format
+# Metrics register themselves in a registry when they are created, render() writes all of them
+# Label values are passed as keyword arguments: LATENCY.observe(0.2, route="/search")
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+class Metric:
+    kind = "untyped"
+
+    # function, when given, is called for the value on every render instead of keeping one
+    def __init__(self, name, help, registry=REGISTRY, function=None):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def get(self, **labels):
+        if self.function is not None:
+            return self.function()
+        return self.values.get(label_key(labels), 0.0)
+
+    def samples(self):
+        if self.function is not None:
+            return [f"{self.name} {format_value(self.function())}"]
+        with self.lock:
+            values = sorted(self.values.items())
+        return [f"{self.name}{format_labels(key)} {format_value(value)}" for key, value in values]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    # Sum over every label value
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+# Latency buckets in seconds, from a cached query to a slow download
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets) + (math.inf, )
+        super().__init__(name, help, registry)
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[position] += 1
+            self.values[key] = (counts, total + value)
+
+    # Times the block and observes the seconds it took
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self.lock:
+            counts, _ = self.values.get(label_key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def sum(self, **labels):
+        with self.lock:
+            _, total = self.values.get(label_key(labels), ([0], 0.0))
+            return total
+
+    # Upper bound of the bucket the q-th quantile falls in, None without observations
+    def quantile(self, q, **labels):
+        with self.lock:
+            counts, _ = self.values.get(label_key(labels), ([0] * len(self.buckets), 0.0))
+            counts = list(counts)
+        observations = sum(counts)
+        if observations == 0:
+            return None
+        rank = q * observations
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+# Acquire a lock and observe how long the wait was
+@contextmanager
+def timed_lock(mutex, histogram, **labels):
+    start = time.perf_counter()
+    with mutex:
+        histogram.observe(time.perf_counter() - start, **labels)
+        yield
+
+# Serve render() on http://host:port/metrics from a daemon thread
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,67 +1,72 @@
+from scipy.sparse import csr_matrix
+import itertools
 import math
-import sqlite3
+import numpy as np
 
-def db_connect():
-    connection = sqlite3.connect("search.db", check_same_thread=False)
-    cursor = connection.cursor()
+from database.schema import connect
 
-    return connection, cursor
+def db_connect():
+    return connect("search.db")
 
-def ranking(connection, cursor, damping=0.85, iterations=20, tolerance=1.0e-6):
-    cursor.execute("SELECT id FROM URLs WHERE crawled = 1")
-    nodes = [row[0] for row in cursor.fetchall()]
+def ranking(connection, cursor, damping=0.85, iterations=100, tolerance=1.0e-6, warm_start=False):
+    cursor.execute("SELECT id FROM URLs WHERE crawled = 1 ORDER BY id")
+    nodes = np.fromiter((row[0] for row in cursor), dtype=np.int64)
     num_nodes = len(nodes)
 
     if num_nodes == 0:
         print("No urls to calculate")
         return
 
-    pagerank = {url: 1.0 / num_nodes for url in nodes}
-
-    num_outgoing_links = {}
-    incoming_links = {}
-
-    cursor.execute("SELECT source_id, COUNT(*) FROM CONNECTIONS GROUP BY source_id")
-    # Get count of how many links that source url points to
-    for source_id, count in cursor:
-        num_outgoing_links[source_id] = count
-
-    cursor.execute("SELECT target_id, source_id FROM CONNECTIONS")
-    # Get what urls point to a url
-    for target_id, source_id in cursor:
-        if incoming_links.get(target_id) is None:
-            incoming_links[target_id] = []
-        incoming_links[target_id].append(source_id)
-    dangling_nodes = set(link for link in nodes if num_outgoing_links.get(link, 0) == 0)
-
-    updated_pagerank = {}
-    dangling_sum = damping * sum(pagerank[node] for node in dangling_nodes) / num_nodes
+    # Load every edge once as a flat array of (source, target) pairs
+    cursor.execute("SELECT source_id, target_id FROM CONNECTIONS")
+    edges = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 2)
+
+    # Turn url ids into positions in nodes and keep edges between crawled urls only
+    sources = np.searchsorted(nodes, edges[:, 0])
+    targets = np.searchsorted(nodes, edges[:, 1])
+    sources[sources == num_nodes] = 0
+    targets[targets == num_nodes] = 0
+    valid = (nodes[sources] == edges[:, 0]) & (nodes[targets] == edges[:, 1]) & (sources != targets)
+    pairs = np.unique(sources[valid] * num_nodes + targets[valid])
+    sources = pairs // num_nodes
+    targets = pairs % num_nodes
+
+    # Column-stochastic link matrix, each url splits its rank between its outgoing links
+    num_outgoing_links = np.bincount(sources, minlength=num_nodes)
+    weights = 1.0 / num_outgoing_links[sources]
+    links = csr_matrix((weights, (targets, sources)), shape=(num_nodes, num_nodes))
+    dangling_nodes = num_outgoing_links == 0
 
     # Calculate the pagerank score for each crawled url
-    for _ in range(iterations):
-        for node in nodes:
-            rank = (1.0 - damping) / num_nodes
-            rank += dangling_sum
-            
-            if node in incoming_links:
-                for source in incoming_links[node]:
-                    if num_outgoing_links.get(source, 0) > 0:
-                        rank += damping * pagerank[node] / num_outgoing_links[source]
-
-            updated_pagerank[node] = rank
-
-        change = sum(abs(updated_pagerank[node] - pagerank[node]) for node in nodes)
+    pagerank = np.full(num_nodes, 1.0 / num_nodes)
+    if warm_start:
+        # Start from the last scores, new urls start at the uniform value
+        cursor.execute("SELECT url_id, rank FROM RANKS")
+        previous = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.float64).reshape(-1, 2)
+        positions = np.searchsorted(nodes, previous[:, 0].astype(np.int64))
+        positions[positions == num_nodes] = 0
+        known = nodes[positions] == previous[:, 0].astype(np.int64)
+        pagerank[positions[known]] = previous[known, 1]
+        pagerank /= pagerank.sum()
+
+    iteration = 0
+    for iteration in range(1, iterations + 1):
+        # Urls without outgoing links spread their rank over every url
+        dangling_sum = pagerank[dangling_nodes].sum() / num_nodes
+        updated_pagerank = damping * (links @ pagerank + dangling_sum) + (1.0 - damping) / num_nodes
+
+        change = np.abs(updated_pagerank - pagerank).sum()
+        pagerank = updated_pagerank
         if change < tolerance:
             break
-        pagerank = updated_pagerank
-    for node in nodes:
-        pagerank[node] = round(pagerank[node], 6)
-        cursor.execute("INSERT OR REPLACE INTO RANKS (url_id, rank) VALUES (?, ?)", (node, pagerank[node]))
+
+    pagerank = np.round(pagerank, 6)
+    cursor.executemany("INSERT OR REPLACE INTO RANKS (url_id, rank) VALUES (?, ?)", zip(nodes.tolist(), pagerank.tolist()))
 
     connection.commit()
-    print("Pagerank scores calculated")
+    print(f"Pagerank scores calculated in {iteration} iterations")
     
-    return pagerank
+    return dict(zip(nodes.tolist(), pagerank.tolist()))
 
 
 # Calculate the tf-idf score for each word in the url
@@ -73,49 +78,101 @@ def tf_idf(connection, cursor):
         if count == 0 :
             print("No urls to calculate")
             return
-        
-        cursor.execute("""
-            SELECT i.word_id, i.page_id, i.frequency, u.word_count 
-            FROM INVERTED_INDEX i
-            JOIN URLs u ON i.page_id = u.id
-            WHERE u.crawled = 1 AND u.word_count > 0
-        """)
 
-        BATCH_SIZE = 5000
-        buffer = []
+        # Document frequency of every word, kept for incremental runs
+        cursor.execute("DELETE FROM WORD_STATS")
+        cursor.execute("INSERT INTO WORD_STATS (word_id, doc_freq) SELECT word_id, COUNT(*) FROM INVERTED_INDEX GROUP BY word_id")
 
-        for word_id, page_id, freq, word_count in cursor.fetchall():
-            term_freq = freq / word_count
-            cursor.execute("SELECT COUNT(*) FROM INVERTED_INDEX WHERE word_id = ?", (word_id, ))
-            docs_containing_word = cursor.fetchone()[0]
+        score_postings(connection, cursor, count)
 
-            inverse_doc_freq = math.log(count / docs_containing_word)
+        # Every score is up to date now
+        cursor.execute("INSERT OR REPLACE INTO SCORE_STATE (name, value) VALUES ('tf_idf_pages', ?)", (count, ))
+        cursor.execute("DELETE FROM DIRTY_WORDS")
+        cursor.execute("DELETE FROM DIRTY_PAGES")
 
-            tf_idf = round(term_freq * inverse_doc_freq, 6)
+        print("tf-idf scores calculated")
 
-            buffer.append((tf_idf, word_id, page_id))
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"Error: {e}")
 
-            if len(buffer) > BATCH_SIZE:
-                cursor.executemany("UPDATE INVERTED_INDEX SET score = ? WHERE word_id = ? AND page_id = ?", buffer)
-                buffer = []
-                connection.commit()
+# Only rescore words and pages the crawler changed since the last run
+# The page count in the idf stays at its last full run value until it drifts by more than max_drift
+def tf_idf_incremental(connection, cursor, max_drift=0.05):
+    try:
+        cursor.execute("SELECT COUNT(*) FROM URLs WHERE crawled = 1")
+        count = cursor.fetchone()[0]
+        cursor.execute("SELECT value FROM SCORE_STATE WHERE name = 'tf_idf_pages'")
+        row = cursor.fetchone()
 
-        if buffer:
-            cursor.executemany("UPDATE INVERTED_INDEX SET score = ? WHERE word_id = ? AND page_id = ?", buffer)
+        if row is None or row[0] == 0 or abs(count - row[0]) / row[0] > max_drift:
+            print("Too many new urls for an incremental run")
+            return tf_idf(connection, cursor)
+        count = row[0]
 
-        print("tf-idf scores calculated")
+        # Document frequencies only move for words that were written
+        cursor.execute("""
+            INSERT OR REPLACE INTO WORD_STATS (word_id, doc_freq)
+            SELECT word_id, COUNT(*) FROM INVERTED_INDEX
+            WHERE word_id IN (SELECT word_id FROM DIRTY_WORDS)
+            GROUP BY word_id
+        """)
+        cursor.execute("""
+            DELETE FROM WORD_STATS WHERE word_id IN (SELECT word_id FROM DIRTY_WORDS)
+                AND NOT EXISTS (SELECT 1 FROM INVERTED_INDEX i WHERE i.word_id = WORD_STATS.word_id)
+        """)
+
+        score_postings(connection, cursor, count, dirty=True)
+
+        cursor.execute("SELECT COUNT(*) FROM DIRTY_WORDS")
+        words = cursor.fetchone()[0]
+        cursor.execute("DELETE FROM DIRTY_WORDS")
+        cursor.execute("DELETE FROM DIRTY_PAGES")
+
+        print(f"tf-idf scores updated for {words} words")
 
         connection.commit()
     except Exception as e:
+        connection.rollback()
         print(f"Error: {e}")
 
+# Score postings from WORD_STATS, only the dirty words and pages when dirty is set
+def score_postings(connection, cursor, count, dirty=False):
+    # sqlite only has ln() when built with math functions
+    connection.create_function("ln", 1, math.log, deterministic=True)
+
+    # Inverse document frequency computed once per word
+    cursor.execute("DROP TABLE IF EXISTS temp.IDF")
+    cursor.execute("CREATE TEMP TABLE IDF (word_id INTEGER PRIMARY KEY, idf REAL)")
+    cursor.execute("INSERT INTO temp.IDF (word_id, idf) SELECT word_id, ln(CAST(? AS REAL) / doc_freq) FROM WORD_STATS", (count, ))
+
+    update = """
+        UPDATE INVERTED_INDEX
+        SET score = ROUND(CAST(INVERTED_INDEX.frequency AS REAL) / u.word_count * d.idf, 6)
+        FROM URLs u, temp.IDF d
+        WHERE u.id = INVERTED_INDEX.page_id AND d.word_id = INVERTED_INDEX.word_id
+            AND u.crawled = 1 AND u.word_count > 0
+    """
+    if dirty:
+        cursor.execute(update + " AND INVERTED_INDEX.word_id IN (SELECT word_id FROM DIRTY_WORDS)")
+        cursor.execute(update + " AND INVERTED_INDEX.page_id IN (SELECT page_id FROM DIRTY_PAGES)")
+    else:
+        # Score every posting in one statement
+        cursor.execute(update)
+    cursor.execute("DROP TABLE temp.IDF")
+
 
 # Combine the tf-idf score and pagerank score into one for each crawled url
-def combine_scores(connection, cursor, alpha=0.7):
+# With changed_only, urls whose final rank moved less than epsilon are not rewritten
+def combine_scores(connection, cursor, alpha=0.7, changed_only=False, epsilon=1.0e-6):
     try:
         cursor.execute('''SELECT page_id, SUM(score) FROM INVERTED_INDEX WHERE page_id IN (
                             SELECT id FROM URLs WHERE crawled = 1 AND word_count > 0) GROUP BY page_id''')
-        tf_idf_scores = {row[0]: row[1] for row in cursor.fetchall()}
+        tf_idf_scores = {row[0]: row[1] or 0.0 for row in cursor.fetchall()}
+        if not tf_idf_scores:
+            print("No urls to calculate")
+            return
         max_score = max(tf_idf_scores.values())
         min_score = min(tf_idf_scores.values())
 
@@ -124,27 +181,30 @@ def combine_scores(connection, cursor, alpha=0.7):
         else:
             normalized_tf_idf_scores = {page_id: (score - min_score) / (max_score - min_score) for page_id, score in tf_idf_scores.items()}
 
-        ids = list(tf_idf_scores.keys())
-        bindings = ", ".join(["?"] * len(ids))
-        cursor.execute(f"SELECT url_id, rank FROM RANKS WHERE url_id IN ({bindings})", ids)
+        cursor.execute("SELECT r.url_id, r.rank, u.final_rank FROM RANKS r JOIN URLs u ON u.id = r.url_id")
 
-        BATCH_SIZE = 1000
         buffer = []
-
-        for url_id, rank in cursor.fetchall():
+        for url_id, rank, final_rank in cursor.fetchall():
+            if url_id not in normalized_tf_idf_scores:
+                continue
             final_score = alpha * normalized_tf_idf_scores[url_id] + (1 - alpha) * rank
+            if changed_only and final_rank is not None and abs(final_score - final_rank) < epsilon:
+                continue
             buffer.append((final_score, url_id))
 
-            if len(buffer) > BATCH_SIZE:
-                cursor.executemany("UPDATE URLs SET final_rank = ? WHERE id = ?", buffer)
-                buffer = []
+        cursor.executemany("UPDATE URLs SET final_rank = ? WHERE id = ?", buffer)
 
-        if buffer:
-            cursor.executemany("UPDATE URLs SET final_rank = ? WHERE id = ?", buffer)
+        # Collection statistics for BM25 at query time
+        cursor.execute("SELECT COUNT(*), AVG(word_count) FROM URLs WHERE crawled = 1 AND word_count > 0")
+        doc_count, avg_word_count = cursor.fetchone()
+        cursor.executemany("INSERT OR REPLACE INTO SCORE_STATE (name, value) VALUES (?, ?)", [("doc_count", doc_count), ("avg_word_count", avg_word_count or 0.0)])
+        # Tell the search server its cached results are stale
+        cursor.execute("INSERT INTO SCORE_STATE (name, value) VALUES ('generation', 1) ON CONFLICT (name) DO UPDATE SET value = value + 1")
 
-        print("Pagerank scores and tf-idf scores combined successfully")
+        print(f"Pagerank scores and tf-idf scores combined successfully ({len(buffer)} urls updated)")
         connection.commit()
     except Exception as e:
+        connection.rollback()
         print(f"Error: {e}")
 
 
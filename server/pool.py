@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from queue import Empty, Full, LifoQueue
+import sqlite3
+
+from database.schema import PRAGMAS
+
+# Read-only connections to search.db reused across requests
+# Each worker process builds its own pool, a connection is used by one thread at a time
+# sqlite keeps the prepared statements of a connection, so reusing connections also reuses
+# the compiled queries instead of parsing them on every request
+class ConnectionPool:
+    def __init__(self, path="search.db", size=8, cached_statements=256):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.connections = LifoQueue(maxsize=size)
+
+    def open(self):
+        # mode=ro never creates the file and never takes a write lock
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+                                     cached_statements=self.cached_statements)
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    # Yields a cursor, the connection goes back to the pool afterwards
+    @contextmanager
+    def cursor(self):
+        try:
+            connection = self.connections.get_nowait()
+        except Empty:
+            connection = self.open()
+
+        cursor = connection.cursor()
+        broken = False
+        try:
+            yield cursor
+        except sqlite3.DatabaseError:
+            broken = True
+            raise
+        finally:
+            if broken:
+                # A connection that failed is not handed out again
+                connection.close()
+            else:
+                # Resets an unfinished statement, so an idle connection holds no read snapshot of the WAL
+                cursor.close()
+                try:
+                    self.connections.put_nowait(connection)
+                except Full:
+                    connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except Empty:
+                break
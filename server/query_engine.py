@@ -0,0 +1,196 @@
+import heapq
+import math
+import sqlite3
+
+from indexing.encoding import decode_positions
+
+# Postings and document statistics read straight from search.db
+class SqliteIndex:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    # Number of documents and their average length, saved by the ranker
+    def stats(self):
+        cursor = self.cursor
+        cursor.execute("SELECT name, value FROM SCORE_STATE WHERE name IN ('doc_count', 'avg_word_count')")
+        stats = dict(cursor.fetchall())
+        if len(stats) < 2:
+            cursor.execute("SELECT COUNT(*), AVG(word_count) FROM URLs WHERE crawled = 1 AND word_count > 0")
+            count, average = cursor.fetchone()
+            stats = {"doc_count": count, "avg_word_count": average or 0.0}
+        return int(stats["doc_count"]), stats["avg_word_count"]
+
+    # List of (page id, frequency, word count, pagerank) for a stemmed term
+    def postings(self, term):
+        self.cursor.execute('''SELECT i.page_id, i.frequency, u.word_count, COALESCE(r.rank, 0)
+                               FROM WORDS w
+                               JOIN INVERTED_INDEX i ON i.word_id = w.id
+                               JOIN URLs u ON u.id = i.page_id
+                               LEFT JOIN RANKS r ON r.url_id = i.page_id
+                               WHERE w.word = ? AND u.crawled = 1 AND u.word_count > 0''', (term, ))
+        return self.cursor.fetchall()
+
+    # Positions of a term on the given pages as {page id: sorted positions}
+    # Pages indexed without positions map to None, the result is None when the database has no positions at all
+    def positions(self, term, page_ids):
+        page_ids = list(page_ids)
+        found = {}
+        try:
+            for start in range(0, len(page_ids), 500):
+                chunk = page_ids[start:start + 500]
+                bindings = ", ".join(["?"] * len(chunk))
+                self.cursor.execute(f'''SELECT i.page_id, i.positions FROM WORDS w
+                                        JOIN INVERTED_INDEX i ON i.word_id = w.id
+                                        WHERE w.word = ? AND i.page_id IN ({bindings})''', (term, *chunk))
+                for page_id, blob in self.cursor.fetchall():
+                    found[page_id] = decode_positions(blob) if blob is not None else None
+        except sqlite3.OperationalError:
+            # Schema from before positions were stored
+            return None
+        return found
+
+# Whether the position lists hold one position of each term right after the other, in order
+# Every list is shifted back by the term's place in the phrase and the sorted lists are merged until they meet
+def phrase_match(position_lists):
+    shifted = [[position - offset for position in positions] for offset, positions in enumerate(position_lists)]
+    pointers = [0] * len(shifted)
+    target = max(positions[0] for positions in shifted)
+    while True:
+        moved = False
+        for number, positions in enumerate(shifted):
+            pointer = pointers[number]
+            while pointer < len(positions) and positions[pointer] < target:
+                pointer += 1
+            if pointer == len(positions):
+                return False
+            pointers[number] = pointer
+            if positions[pointer] > target:
+                target = positions[pointer]
+                moved = True
+        if not moved:
+            return True
+
+# Smallest gap between a position in first and one in second, by merging the two sorted lists
+def min_distance(first, second):
+    best = None
+    i = j = 0
+    while i < len(first) and j < len(second):
+        gap = abs(first[i] - second[j])
+        if best is None or gap < best:
+            best = gap
+        if first[i] < second[j]:
+            i += 1
+        else:
+            j += 1
+    return best
+
+# Keep only pages where every phrase appears, phrases are tuples of stemmed terms
+# Returns False when the index has no positions, the phrase words then only have to be on the page
+def filter_phrases(index, scores, phrases):
+    positions_of = getattr(index, "positions", None)
+    if positions_of is None:
+        return False
+    for phrase in phrases:
+        if not scores:
+            break
+        lists = {}
+        for term in set(phrase):
+            lists[term] = positions_of(term, scores.keys())
+            if lists[term] is None:
+                return False
+        for page_id in list(scores):
+            if any(page_id not in lists[term] for term in phrase):
+                del scores[page_id]
+                continue
+            position_lists = [lists[term][page_id] for term in phrase]
+            # Pages indexed without positions can not be checked and only need the words
+            if all(positions is not None for positions in position_lists) and not phrase_match(position_lists):
+                del scores[page_id]
+    return True
+
+# Raise the score of the best depth pages by weight / gap for every pair of neighbouring query terms,
+# so pages where the terms are close together move up
+def boost_proximity(index, scores, terms, weight, depth):
+    positions_of = getattr(index, "positions", None)
+    if positions_of is None or len(terms) < 2 or weight == 0:
+        return
+    page_ids = [page_id for page_id, _ in top_k(scores, depth)]
+    lists = {}
+    for term in terms:
+        lists[term] = positions_of(term, page_ids)
+        if lists[term] is None:
+            return
+    for page_id in page_ids:
+        boost = 0.0
+        for first, second in zip(terms, terms[1:]):
+            first_positions = lists[first].get(page_id)
+            second_positions = lists[second].get(page_id)
+            if first_positions and second_positions:
+                boost += weight / max(min_distance(first_positions, second_positions), 1)
+        scores[page_id] += boost
+
+# Score every page matching the terms with BM25 plus a pagerank boost
+# match="and" needs every term on the page, match="or" any of them
+# phrases are tuples of terms that have to appear next to each other, their terms are needed with either match
+# With positions in the index, the best proximity_depth pages get a boost when the terms are close together
+# Returns a dict of page id -> score
+def score_pages(index, terms, match="and", k1=1.2, b=0.75, rank_weight=1.0, phrases=(), proximity_weight=1.0, proximity_depth=100):
+    terms = list(dict.fromkeys(terms))
+    if not terms:
+        return {}
+
+    num_docs, avg_length = index.stats()
+    if num_docs == 0:
+        return {}
+    avg_length = avg_length or 1.0
+
+    postings = [index.postings(term) for term in terms]
+    pages_of = {term: {row[0] for row in term_postings} for term, term_postings in zip(terms, postings)} if phrases else {}
+    if match == "and":
+        if any(not term_postings for term_postings in postings):
+            return {}
+        # Start from the shortest list so the intersection stays small
+        postings.sort(key=len)
+        candidates = {row[0] for row in postings[0]}
+        for term_postings in postings[1:]:
+            candidates &= {row[0] for row in term_postings}
+            if not candidates:
+                return {}
+
+    scores = {}
+    ranks = {}
+    for term_postings in postings:
+        doc_freq = len(term_postings)
+        idf = math.log(1.0 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        for page_id, frequency, length, rank in term_postings:
+            if match == "and" and page_id not in candidates:
+                continue
+            norm = k1 * (1.0 - b + b * length / avg_length)
+            scores[page_id] = scores.get(page_id, 0.0) + idf * frequency * (k1 + 1.0) / (frequency + norm)
+            ranks[page_id] = rank
+
+    # Pagerank averages 1 / num_docs, so num_docs * rank is about 1 for an average page
+    for page_id in scores:
+        scores[page_id] += rank_weight * math.log1p(num_docs * ranks[page_id])
+
+    if phrases and not filter_phrases(index, scores, phrases) and match == "or":
+        # Without positions a phrase only needs all of its words on the page, which match="and" already does
+        for term in {term for phrase in phrases for term in phrase}:
+            required = pages_of[term]
+            for page_id in [page_id for page_id in scores if page_id not in required]:
+                del scores[page_id]
+    boost_proximity(index, scores, terms, proximity_weight, proximity_depth)
+    return scores
+
+# Results are ordered by score, ties go to the lower id
+def rank_key(item):
+    return (item[1], -item[0])
+
+# The k best (page id, score) pairs without sorting every match
+def top_k(scores, k):
+    return heapq.nlargest(k, scores.items(), key=rank_key)
+
+# The k best pairs ranked after the (page id, score) pair cursor, the cost does not grow with how deep the cursor is
+def top_k_after(scores, k, cursor):
+    last = rank_key(cursor)
+    return heapq.nlargest(k, (item for item in scores.items() if rank_key(item) < last), key=rank_key)
@@ -0,0 +1,38 @@
+from array import array
+import random
+import threading
+import time
+
+# Random crawled pages for /lucky in constant time
+# The ids of crawled pages are loaded once into an array and picked from by position,
+# they are reloaded when the index generation changes, at most once every refresh_interval seconds
+class PageSampler:
+    def __init__(self, refresh_interval=60.0, attempts=5):
+        self.refresh_interval = refresh_interval
+        self.attempts = attempts
+        self.page_ids = array("q")
+        self.generation = None
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def load(self, cursor, generation):
+        cursor.execute("SELECT id FROM URLs WHERE crawled = 1 AND word_count > 0")
+        page_ids = array("q", (row[0] for row in cursor))
+        with self.lock:
+            self.page_ids = page_ids
+            self.generation = generation
+            self.loaded_at = time.time()
+
+    # Url of a random crawled page, None if there are none
+    def sample(self, cursor, generation):
+        if self.generation is None or (generation != self.generation and time.time() - self.loaded_at >= self.refresh_interval):
+            self.load(cursor, generation)
+
+        page_ids = self.page_ids
+        # A page removed since the ids were loaded is skipped
+        for _ in range(self.attempts if page_ids else 0):
+            cursor.execute("SELECT url FROM URLs WHERE id = ?", (page_ids[random.randrange(len(page_ids))], ))
+            row = cursor.fetchone()
+            if row is not None:
+                return row[0]
+        return None
@@ -1,9 +1,47 @@
-from flask import Flask, redirect, render_template, request, jsonify
+from flask import Flask, Response, g, redirect, render_template, request, jsonify
+import time
 
-from searching import search_api, random_api, search_images
+from searching import (current_generation, decode_cursor, image_batch, result_cache, search_api, search_batch,
+                       random_api, search_images)
+from streaming import choose_encoding, compressed, make_etag, ndjson, trim_results
+from monitoring.metrics import REGISTRY, Counter, Gauge, Histogram
 
 app = Flask(__name__, template_folder="../templates", static_folder="../static")
 
+# Metrics of this worker process, served on /metrics
+REQUEST_SECONDS = Histogram("search_request_seconds", "Time to answer a request by route")
+REQUESTS = Counter("search_requests_total", "Requests answered by route and status")
+Counter("search_cache_hits_total", "Queries answered from the result cache", function=lambda: result_cache.hits)
+Counter("search_cache_misses_total", "Queries that had to be scored", function=lambda: result_cache.misses)
+Gauge("search_cache_hit_ratio", "Share of queries answered from the result cache",
+      function=lambda: result_cache.hits / max(result_cache.hits + result_cache.misses, 1))
+Gauge("search_cache_bytes", "Estimated size of the result cache", function=lambda: result_cache.size)
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+# Streamed responses are produced after this hook, their time is taken once the server closes them
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    if "start" in g:
+        start = g.start
+
+        def observe():
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route=route)
+
+        if response.is_streamed:
+            response.call_on_close(observe)
+        else:
+            observe()
+    REQUESTS.inc(route=route, status=response.status_code)
+    return response
+
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -13,17 +51,24 @@ def search():
     search = request.args.get("search", "")
 
     if request.method == "POST":
-        page = int(request.args.get("page", ""))
-        results, page_count = search_api(search, page)
-        return jsonify({"data": results, "page_count": page_count}), 201
+        # A cursor from the last response continues after its last result, page jumps to an offset
+        cursor = request.args.get("cursor")
+        page = int(request.args.get("page", "1"))
+        try:
+            results, page_count, next_cursor = search_api(search, page, after=cursor)
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+        return jsonify({"data": trim_results(results), "page_count": page_count, "next_cursor": next_cursor}), 201
 
-    results, page_count = search_api(search)
+    results, page_count, next_cursor = search_api(search)
 
-    return render_template("search.html", search=search, results=results, page_count=page_count)
+    return render_template("search.html", search=search, results=results, page_count=page_count, next_cursor=next_cursor)
 
 @app.route("/lucky")
 def lucky():
     random_page = random_api()
+    if random_page is None:
+        return redirect("/")
 
     return redirect(random_page)
 
@@ -39,3 +84,47 @@ def images():
     images = search_images(search)
 
     return render_template("search.html", images=images, search=search)
+
+# Most pages one batch request can ask for
+MAX_BATCH_PAGES = 10
+
+# Several result pages in one response as newline-delimited JSON
+# pages asks for that many pages, budget stops after about that many bytes of JSON,
+# the last line says where the next batch starts
+def batch_response(make_pages):
+    pages = min(max(request.args.get("pages", 1, type=int), 1), MAX_BATCH_PAGES)
+    budget = request.args.get("budget", type=int)
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+
+    # Same index, same request, same answer, so a client that has it gets a 304 without any work
+    etag = make_etag(current_generation(), request.path, request.args.items(multi=True), encoding)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(compressed(ndjson(make_pages(pages), budget), encoding), mimetype="application/x-ndjson")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag, weak=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/api/search")
+def search_stream():
+    search = request.args.get("search", "")
+    cursor = request.args.get("cursor")
+    page = request.args.get("page", 1, type=int)
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+
+    return batch_response(lambda pages: search_batch(search, page, pages, after=cursor))
+
+@app.route("/api/images")
+def images_stream():
+    search = request.args.get("search", "")
+    page = request.args.get("page", 1, type=int)
+
+    return batch_response(lambda pages: image_batch(search, page, pages))
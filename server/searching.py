@@ -1,84 +1,224 @@
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
-from nltk.tokenize import word_tokenize
+import bisect
 import math
-import nltk
+import os
+import re
 import sqlite3
-
-
-ps = PorterStemmer()
-
-def db_connect():
-    connection = sqlite3.connect("search.db", check_same_thread=False)
-    cursor = connection.cursor()
-
-    return connection, cursor
-
-def download_nltk():
-    try:
-        stopwords.words('english')
-    except LookupError:
-        nltk.download('stopwords')
-    try:
-        word_tokenize('test')
-    except LookupError:
-        nltk.download('punkt')
-
-def search_api(user_search, page=1, items_per_page=20):
-    connection, cursor = db_connect()
+import struct
+import sys
+
+# Shared modules live next to the server folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cache import ResultCache
+from indexing.analysis import analyze
+from indexing.compact_index import CompactIndex
+from pool import ConnectionPool
+from query_engine import SqliteIndex, rank_key, score_pages, top_k, top_k_after
+from sampler import PageSampler
+from streaming import trim_images, trim_results
+
+
+# Built with "python -m indexing.compact_index", queries fall back to search.db without it
+INDEX_DIR = "index"
+
+def load_index():
+    if os.path.exists(os.path.join(INDEX_DIR, "meta.json")):
+        return CompactIndex(INDEX_DIR)
+    return None
+
+memory_index = load_index()
+
+# Ranked results of recent queries, so paging through them does not score them again
+result_cache = ResultCache()
+# Rankings are cached this deep, deeper pages are scored again
+CACHE_DEPTH = 1000
+
+# The crawler owns the schema, the server only reads through pooled read-only connections
+pool = ConnectionPool("search.db")
+page_sampler = PageSampler()
+
+# Stemmed, stopword-free words of a query, whether they are and-ed or or-ed and the quoted phrases
+def analyze_query(user_search):
+    # "OR" between words matches pages with any of the words, otherwise pages need all of them
+    match = "or" if "OR" in user_search.split() else "and"
+
+    # Same analysis as the indexer so query words match indexed words
+    words = analyze(user_search)
+
+    # Words in quotes have to be next to each other on the page, in the same order
+    phrases = [tuple(analyze(phrase)) for phrase in re.findall(r'"([^"]*)"', user_search)]
+    phrases = [phrase for phrase in phrases if len(phrase) > 1]
+
+    return words, match, phrases
+
+# Bumped by the crawler and the ranker whenever search.db changes
+def index_generation(cursor):
+    cursor.execute("SELECT value FROM SCORE_STATE WHERE name = 'generation'")
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+# Generation of whichever index answers a query, the compact index only changes when it is rebuilt
+def query_generation(cursor, phrases=()):
+    index = query_index(cursor, phrases)
+    if index is memory_index:
+        return ("compact", memory_index.generation)
+    return ("sqlite", index_generation(cursor))
+
+# Ranked (page id, score) pairs of at least the first depth results and the total number of matches
+def ranked_pages(cursor, words, match, phrases, depth):
+    # Word order counts once positions are used, so the key keeps it
+    key = ("search", query_generation(cursor, phrases), match, tuple(words), tuple(phrases))
+    cached = result_cache.get(key)
+    if cached is not None and (len(cached[0]) >= depth or len(cached[0]) == cached[1]):
+        return cached
+
+    scores = score_pages(query_index(cursor, phrases), words, match, phrases=phrases)
+    result = (top_k(scores, max(depth, CACHE_DEPTH)), len(scores))
+    result_cache.put(key, result)
+    return result
+
+# The compact index has no word positions, queries with phrases are answered from search.db
+def query_index(cursor, phrases=()):
+    if memory_index is None or phrases:
+        return SqliteIndex(cursor)
+    return memory_index
+
+# A cursor is the page id and exact score of the last result shown, the next page starts right after it
+# The score is kept as the 16 hex digits of the double, so it survives the trip through a url unchanged
+def encode_cursor(item):
+    page_id, score = item
+    return f"{page_id}-{struct.pack('>d', score).hex()}"
+
+# Raises ValueError for anything encode_cursor did not make
+def decode_cursor(cursor):
+    page_id, score = cursor.split("-", 1)
+    if len(score) != 16:
+        raise ValueError(f"invalid cursor: {cursor}")
+    return int(page_id), struct.unpack(">d", bytes.fromhex(score))[0]
+
+# One page of results, either page (offset) or after (a cursor from the previous page) picks it
+# Returns the results, the number of pages and the cursor of the next page (None on the last page)
+def search_api(user_search, page=1, items_per_page=20, after=None):
+    # Page numbers come straight from the request, anything below 1 is the first page
+    page = max(page, 1)
     offset = (page - 1) * items_per_page
-
-    download_nltk()
-
-    stop_words = set(stopwords.words('english'))
-    tokens = word_tokenize(user_search.lower())
-    valid_words = [ps.stem(word) for word in tokens if word.isalpha() and word not in stop_words]
-    words = [word for word in valid_words]
-    bindings = ", ".join(["?"] * len(words))
-
-    cursor.execute(f'''SELECT COUNT(*) FROM URLs WHERE id IN (
-                        SELECT page_id FROM INVERTED_INDEX WHERE word_id IN (
-                            SELECT id FROM WORDS WHERE word IN ({bindings})
-                        )          
-                   )''', tuple(words))
-    
-    count = cursor.fetchone()[0]
-    page_count = math.ceil(count / items_per_page)
-
-    params = tuple(words) + (items_per_page, offset)
-
-    cursor.execute(f'''SELECT title, url, description FROM URLs WHERE id IN (
-                        SELECT page_id FROM INVERTED_INDEX WHERE word_id IN (
-                            SELECT id FROM WORDS WHERE word IN ({bindings})
-                        )          
-                   ) ORDER BY final_rank DESC LIMIT ? OFFSET ?''', params)    
-
-    search = cursor.fetchall()
-
-    connection.close()
-    
-    return search, page_count
-
-# Get a random url from lucky
+    words, match, phrases = analyze_query(user_search)
+
+    with pool.cursor() as cursor:
+        if after is None:
+            ranked, count = ranked_pages(cursor, words, match, phrases, offset + items_per_page)
+            selected = ranked[offset:offset + items_per_page]
+            more = offset + len(selected) < count
+        else:
+            after = decode_cursor(after)
+            ranked, count = ranked_pages(cursor, words, match, phrases, items_per_page)
+            # The cached ranking is sorted by descending rank_key, so the cursor is found by bisection
+            last = rank_key(after)
+            position = bisect.bisect_left(ranked, True, key=lambda item: rank_key(item) < last)
+            if position + items_per_page <= len(ranked) or len(ranked) == count:
+                selected = ranked[position:position + items_per_page]
+                more = position + len(selected) < count
+            else:
+                # Deeper than the cached ranking, only the page after the cursor is picked out of the scores
+                scores = score_pages(query_index(cursor, phrases), words, match, phrases=phrases)
+                selected = top_k_after(scores, items_per_page, after)
+                count = len(scores)
+                more = len(selected) == items_per_page
+
+        page_count = math.ceil(count / items_per_page)
+
+        # Only the requested page is looked up
+        search = fetch_pages(cursor, [page_id for page_id, _ in selected])
+
+    next_cursor = encode_cursor(selected[-1]) if selected and more else None
+    return search, page_count, next_cursor
+
+# Up to pages result pages in a row as dicts for the streaming API, starting at page or after a cursor
+# A cursor does not say how deep it is, so pages after one have no "page" number
+def search_batch(user_search, page=1, pages=1, items_per_page=20, after=None):
+    page = max(page, 1)
+    numbered = after is None
+    for _ in range(pages):
+        results, page_count, next_cursor = search_api(user_search, page, items_per_page, after)
+        line = {"page_count": page_count, "data": trim_results(results), "next_cursor": next_cursor}
+        if numbered:
+            line["page"] = page
+        yield line
+        if next_cursor is None:
+            return
+        page += 1
+        after = next_cursor
+
+def image_batch(user_search, page=1, pages=1, items_per_page=20):
+    page = max(page, 1)
+    for page in range(page, page + pages):
+        images = search_images(user_search, page, items_per_page)
+        more = len(images) == items_per_page
+        yield {"page": page, "data": trim_images(images), "next_page": page + 1 if more else None}
+        if not more:
+            return
+
+# Rankings may come from the compact index while titles and images always come from search.db
+def current_generation():
+    with pool.cursor() as cursor:
+        generation = index_generation(cursor)
+    if memory_index is not None:
+        return generation, memory_index.generation
+    return generation
+
+# Title, url and description of pages in the given order
+def fetch_pages(cursor, page_ids):
+    if not page_ids:
+        return []
+    bindings = ", ".join(["?"] * len(page_ids))
+    cursor.execute(f"SELECT id, title, url, description FROM URLs WHERE id IN ({bindings})", page_ids)
+    pages = {row[0]: row[1:] for row in cursor.fetchall()}
+    return [pages[page_id] for page_id in page_ids if page_id in pages]
+
+# Get a random url from lucky, None before anything is crawled
 def random_api():
-    connection, cursor = db_connect()
-
-    cursor.execute("SELECT url FROM URLs WHERE crawled = 1 ORDER BY RANDOM() LIMIT 1")
-    random_url = cursor.fetchone()[0]
-    connection.close()
-
-    return random_url
+    with pool.cursor() as cursor:
+        return page_sampler.sample(cursor, index_generation(cursor))
 
 def search_images(user_search, page=1, items_per_page=20):
-    connection, cursor = db_connect()
+    page = max(page, 1)
     offset = (page - 1) * items_per_page
 
-    cursor.execute(f"SELECT image, alt, source_url FROM IMAGES WHERE context LIKE ? LIMIT ? OFFSET ?", (f"%{user_search}%", items_per_page, offset, ))
-    images = cursor.fetchall()
-    connection.close()
-    
+    with pool.cursor() as cursor:
+        key = ("images", index_generation(cursor), user_search.strip().lower(), page, items_per_page)
+        images = result_cache.get(key)
+        if images is None:
+            try:
+                images = search_image_index(cursor, user_search, items_per_page, offset)
+            except sqlite3.OperationalError:
+                # Databases without the full-text index
+                cursor.execute("SELECT image, alt, source_url FROM IMAGES WHERE context LIKE ? LIMIT ? OFFSET ?", (f"%{user_search}%", items_per_page, offset, ))
+                images = cursor.fetchall()
+            result_cache.put(key, images)
+
     return images
 
+# Weights of alt, title and context text in the image ranking
+IMAGE_COLUMN_WEIGHTS = (2.0, 1.0, 0.5)
+# How much the rank of the page an image was found on counts
+IMAGE_PAGE_WEIGHT = 2.0
+
+def search_image_index(cursor, user_search, items_per_page, offset):
+    # Quote every word so user input can not use the FTS5 query syntax
+    words = re.findall(r"\w+", user_search.lower())
+    if not words:
+        return []
+    query = " OR ".join(f'"{word}"' for word in words)
+
+    # bm25() is lower for better matches, so the page rank is subtracted
+    cursor.execute('''SELECT i.image, i.alt, i.source_url FROM IMAGES_FTS f
+                      JOIN IMAGES i ON i.id = f.rowid
+                      LEFT JOIN URLs u ON u.url = i.source_url
+                      WHERE IMAGES_FTS MATCH ?
+                      ORDER BY bm25(IMAGES_FTS, ?, ?, ?) - ? * COALESCE(u.final_rank, 0)
+                      LIMIT ? OFFSET ?''', (query, *IMAGE_COLUMN_WEIGHTS, IMAGE_PAGE_WEIGHT, items_per_page, offset))
+    return cursor.fetchall()
+
 def main():
     search_api()
 
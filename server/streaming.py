@@ -0,0 +1,93 @@
+import hashlib
+import json
+import zlib
+
+# Brotli compresses text better than gzip, it is used when installed and the client accepts it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Result pages as newline-delimited JSON, one page per line, compressed as they are produced
+# Every line is flushed through the compressor so the client can show a page before the batch is done
+
+# Strings longer than this are cut, the pages only show the start of them
+TEXT_LENGTH = 200
+
+def trim(text, length=TEXT_LENGTH):
+    if text is None or len(text) <= length:
+        return text
+    return text[:length].rstrip() + "..."
+
+# Results as [title, url, description] and images as [image, alt, source url], with long text cut
+def trim_results(results):
+    return [[trim(title), url, trim(description)] for title, url, description in results]
+
+def trim_images(images):
+    return [[image, trim(alt), source_url] for image, alt, source_url in images]
+
+# Best encoding the client accepts out of br, gzip and identity
+def choose_encoding(accept_encoding):
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, parameters = part.strip().partition(";")
+        quality = 1.0
+        if parameters.strip().startswith("q="):
+            try:
+                quality = float(parameters.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return "identity"
+
+class Compressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT)
+        elif encoding == "gzip":
+            # wbits 31 writes the gzip header and trailer
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    # Compressed bytes of data, flushed so they can be decoded without what follows
+    def chunk(self, data):
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        if self.encoding == "gzip":
+            return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    def finish(self):
+        if self.encoding == "br":
+            return self.compressor.finish()
+        if self.encoding == "gzip":
+            return self.compressor.flush()
+        return b""
+
+# Lines of pages stop once byte_budget bytes of JSON were produced, the page that goes over it is still sent
+def ndjson(pages, byte_budget=None):
+    sent = 0
+    for page in pages:
+        line = json.dumps(page, separators=(",", ":")).encode("utf-8") + b"\n"
+        yield line
+        sent += len(line)
+        if byte_budget is not None and sent >= byte_budget:
+            break
+
+def compressed(lines, encoding):
+    compressor = Compressor(encoding)
+    for line in lines:
+        yield compressor.chunk(line)
+    yield compressor.finish()
+
+# Results only change with the index, so the generation and the request identify a response
+# The tag is sent as a weak ETag, the bytes differ with the compression level
+def make_etag(generation, path, arguments, encoding):
+    key = json.dumps([generation, path, sorted(arguments), encoding])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
@@ -1,6 +1,12 @@
 let currentPage = 1;
 const pageCount = document.querySelector('meta[name="page-count"]');
 const pageCountContent = parseInt(pageCount.content);
+// Cursors of the pages reached so far, page n is loaded right after the last result of page n - 1
+const nextCursor = document.querySelector('meta[name="next-cursor"]');
+const cursors = {};
+if (nextCursor && nextCursor.content) {
+    cursors[2] = nextCursor.content;
+}
 
 document.addEventListener("DOMContentLoaded", function() {
     window.scrollTo({top: 0, behavior: "smooth"});
@@ -18,7 +24,7 @@ document.addEventListener("DOMContentLoaded", function() {
         document.querySelector("#images").style.color = "rebeccapurple";
         document.querySelector("#all").style.fontWeight = "Normal";
         
-        imagePage();
+        imagePage(searchValue);
     }
 
     document.addEventListener("click", function(event) {
@@ -34,29 +40,30 @@ document.addEventListener("DOMContentLoaded", function() {
     })
 })
 
-function imagePage() {
+// Image pages loaded per request while scrolling
+const IMAGE_BATCH = 3;
+let nextImagePage = 2;
+let loadingImages = false;
+
+function imagePage(search) {
     window.onscroll = () => {
         // Infinite scroll with a buffer of 1
         // Buffer prevents the infinite scroll from breaking
         if (window.innerHeight + window.scrollY >= document.documentElement.offsetHeight - 1) {
-            currentPage++;
-            loadImages(currentPage);
+            loadImages(search);
         }
     }
 }
 
-function loadImages(page) {
-    fetch('/images', {
-        method: "POST",
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            page: page
-        })
-    })
-    .then((response) => response.json())
-    .then((result) => {
+// Loads the next few pages of images in one request, each page is shown as soon as its line arrives
+function loadImages(search) {
+    if (loadingImages || nextImagePage === null) {
+        return;
+    }
+    loadingImages = true;
+
+    fetch(`/api/images?search=${encodeURIComponent(search)}&page=${nextImagePage}&pages=${IMAGE_BATCH}`)
+    .then((response) => readLines(response, (result) => {
         for (let i = 0; i < result["data"].length; i++) {
             document.querySelector("#image-display").innerHTML += `
                 <div class="image-content">
@@ -65,9 +72,35 @@ function loadImages(page) {
                 </div>
             `;
         }
+        nextImagePage = result["next_page"];
+    }))
+    .finally(() => {
+        loadingImages = false;
     })
 }
 
+// Calls onLine with every JSON line of a newline-delimited JSON response as it is received
+async function readLines(response, onLine) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        let newline;
+        while ((newline = buffer.indexOf("\n")) >= 0) {
+            const line = buffer.slice(0, newline);
+            buffer = buffer.slice(newline + 1);
+            if (line) {
+                onLine(JSON.parse(line));
+            }
+        }
+        if (done) {
+            return;
+        }
+    }
+}
+
 function searchPage(search) {
     document.addEventListener("click", function(event) {
         if (event.target.matches("#beginning-arrow")) {
@@ -103,11 +136,20 @@ function searchPage(search) {
 }
 
 function nextPage(page, search) {
-    fetch(`search?search=${encodeURIComponent(search)}&page=${page}`, {
+    // Pages next to ones already seen use their cursor, jumps further away use the page number
+    let url = `search?search=${encodeURIComponent(search)}&page=${page}`;
+    if (cursors[page]) {
+        url = `search?search=${encodeURIComponent(search)}&cursor=${encodeURIComponent(cursors[page])}`;
+    }
+
+    fetch(url, {
         method: "POST"
     })
     .then((response) => response.json())
     .then((result) => {
+        if (result.next_cursor) {
+            cursors[page + 1] = result.next_cursor;
+        }
         document.querySelector("#results-display").innerHTML = "";
         result.data.forEach((result) => {
             document.querySelector("#results-display").innerHTML += `